@@ -8,20 +8,64 @@
 Bond - Your favorite library for logging energy data on the blockchain
 """
 
-import energyweb.config as config
-import energyweb.database.dao as dao
-import energyweb.smart_contract.usn.rent_v1 as iotlayer
-import energyweb.smart_contract.origin_v1 as origin
-
-from energyweb.interfaces import Serializable, ExternalData, IntegrationPoint, BlockchainClient
-from energyweb.log import Logger
-from energyweb.dispatcher import App, Task
-from energyweb.carbonemission import CarbonEmissionData
-from energyweb.eds.interfaces import EnergyUnit, EnergyData, EnergyDevice
-from energyweb.smart_contract.interfaces import EVMSmartContractClient
-from energyweb.storage import OnDiskChain
-from energyweb.database.memorydao import MemoryDAO, MemoryDAOFactory
-from energyweb.database.elasticdao import ElasticSearchDAO, ElasticSearchDAOFactory
+import importlib
+import importlib.util
+
+# public names and the module they are loaded from on first access, PEP 562
+_modules = {
+    'config': 'energyweb.config',
+    'dao': 'energyweb.database.dao',
+    'iotlayer': 'energyweb.smart_contract.usn.rent_v1',
+    'origin': 'energyweb.smart_contract.origin_v1',
+    'usn': 'energyweb.smart_contract.usn_v1',
+}
+_attributes = {
+    'Serializable': 'energyweb.interfaces',
+    'ExternalData': 'energyweb.interfaces',
+    'IntegrationPoint': 'energyweb.interfaces',
+    'BlockchainClient': 'energyweb.interfaces',
+    'Logger': 'energyweb.log',
+    'App': 'energyweb.dispatcher',
+    'Task': 'energyweb.dispatcher',
+    'CarbonEmissionData': 'energyweb.carbonemission',
+    'EnergyUnit': 'energyweb.eds.interfaces',
+    'EnergyData': 'energyweb.eds.interfaces',
+    'EnergyDataBatch': 'energyweb.eds.interfaces',
+    'EnergyDevice': 'energyweb.eds.interfaces',
+    'EVMSmartContractClient': 'energyweb.smart_contract.interfaces',
+    'OnDiskChain': 'energyweb.storage',
+    'MemoryDAO': 'energyweb.database.memorydao',
+    'MemoryDAOFactory': 'energyweb.database.memorydao',
+    'ElasticSearchDAO': 'energyweb.database.elasticdao',
+    'ElasticSearchDAOFactory': 'energyweb.database.elasticdao',
+}
+
+# submodules the package used to import implicitly, also reachable as attributes
+_submodules = ['carbonemission', 'config', 'database', 'dispatcher', 'eds', 'interfaces', 'log', 'smart_contract',
+               'storage']
+
+__all__ = list(_modules) + list(_attributes)
+
+
+def __getattr__(name: str):
+    """
+    Imports the public names on first access, so importing energyweb or one of its modules only loads what is used.
+    Submodules are imported on access too, ie. energyweb.dispatcher or energyweb.eds.
+    """
+    if name in _modules:
+        value = importlib.import_module(_modules[name])
+    elif name in _attributes:
+        value = getattr(importlib.import_module(_attributes[name]), name)
+    elif not name.startswith('_') and importlib.util.find_spec(f'energyweb.{name}') is not None:
+        value = importlib.import_module(f'energyweb.{name}')
+    else:
+        raise AttributeError(f"module 'energyweb' has no attribute '{name}'")
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__) | set(_submodules))
 
 
 __name__ = 'energyweb'
@@ -1,17 +1,28 @@
 """
 Library containing the implementations of CO2 oracles integration classes
 """
+import os
+import json
+import time
 import calendar
 import datetime
-import requests
+import threading
+from array import array
+from bisect import bisect_left
+from concurrent.futures import Future
 
+from energyweb.eds import session
 from energyweb.interfaces import ExternalData, IntegrationPoint
 
+# http status of requests with a missing, expired or revoked token
+UNAUTHORIZED = (401, 403)
+
 
 class CarbonEmissionData(ExternalData):
     """
     Standard for collected carbon emission data, to be transformed into mintable data.
     """
+    __slots__ = ('accumulated_co2', 'measurement_epoch')
 
     def __init__(self, access_epoch, raw, accumulated_co2, measurement_epoch):
         """
@@ -45,9 +56,212 @@ class CarbonEmissionAPI(IntegrationPoint):
         raise NotImplementedError
 
 
+class IntensityCache:
+    """
+    Carbon emission readings shared by the api clients of the process, per provider, balancing authority, query and time
+    bucket. Producers in the same balancing authority querying the same way get the reading of the first one to ask in
+    the bucket. Concurrent misses of the same key wait for a single api request.
+    """
+
+    def __init__(self, bucket_seconds: int = 3600, keep_buckets: int = 24, path: str = None):
+        """
+        :param bucket_seconds: Length of the time bucket a reading is reused for
+        :param keep_buckets: Number of past buckets kept in memory
+        :param path: Json file to persist the readings across restarts, memory only if None
+        """
+        self.bucket_seconds = bucket_seconds
+        self.keep_buckets = keep_buckets
+        self.path = None
+        self._readings = {}
+        self._loading = {}
+        self._lock = threading.Lock()
+        if path:
+            self.persist(path)
+
+    def bucket(self, epoch: float = None) -> int:
+        """
+        :param epoch: Time in seconds, now if None
+        :return: Time bucket of the epoch
+        """
+        return int((time.time() if epoch is None else epoch) // self.bucket_seconds)
+
+    def get(self, provider: str, ba: str, loader, query: str = '') -> CarbonEmissionData:
+        """
+        Reading of the current bucket, loaded if missing.
+        :param provider: Name of the api, ie. the client class name
+        :param ba: Balancing authority
+        :param loader: Function returning a new CarbonEmissionData
+        :param query: Parameters of the client changing the reading, ie. 'hours_from_now=2'
+        :return: CarbonEmissionData
+        """
+        key = (provider, ba, query, self.bucket())
+        with self._lock:
+            if key in self._readings:
+                return self._readings[key]
+            future = self._loading.get(key)
+            leader = future is None
+            if leader:
+                future = self._loading[key] = Future()
+        if not leader:
+            return future.result()
+        try:
+            reading = loader()
+        except Exception as e:
+            with self._lock:
+                del self._loading[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            self._readings[key] = reading
+            del self._loading[key]
+            self._evict(key[-1])
+            if self.path:
+                self._save()
+        future.set_result(reading)
+        return reading
+
+    def persist(self, path: str):
+        """
+        Persist the readings in a json file, loading the ones it already has.
+        :param path: Json file path
+        """
+        with self._lock:
+            self.path = path
+            if os.path.exists(path):
+                with open(path) as file:
+                    for provider, ba, query, bucket, reading in json.load(file):
+                        self._readings.setdefault((provider, ba, query, bucket), CarbonEmissionData(**reading))
+            self._evict(self.bucket())
+
+    def clear(self):
+        with self._lock:
+            self._readings.clear()
+
+    def _evict(self, bucket: int):
+        for key in [k for k in self._readings if k[-1] <= bucket - self.keep_buckets]:
+            del self._readings[key]
+
+    def _save(self):
+        entries = [[provider, ba, query, bucket, reading.to_dict()]
+                   for (provider, ba, query, bucket), reading in self._readings.items()]
+        temporary = self.path + '.tmp'
+        with open(temporary, 'w') as file:
+            json.dump(entries, file)
+        os.replace(temporary, self.path)
+
+
+intensities = IntensityCache()
+
+
+class TokenCache:
+    """
+    Access tokens shared by the api clients of the process, per api and user.
+    A token is reused until refresh_margin seconds before it expires. Concurrent clients needing a new token of the
+    same key wait for a single login, logins of other keys run in parallel.
+    """
+
+    def __init__(self, refresh_margin: float = 60):
+        """
+        :param refresh_margin: Seconds before expiration a token is renewed
+        """
+        self.refresh_margin = refresh_margin
+        self._tokens = {}
+        self._logins = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple, login, ttl: float = None) -> str:
+        """
+        :param key: Api url and user name
+        :param login: Function returning a new token
+        :param ttl: Seconds a new token is valid, forever if None
+        :return: Access token
+        """
+        with self._lock:
+            token, expiry = self._tokens.get(key, (None, None))
+            if token and (expiry is None or time.time() < expiry - self.refresh_margin):
+                return token
+            future = self._logins.get(key)
+            leader = future is None
+            if leader:
+                future = self._logins[key] = Future()
+        if not leader:
+            return future.result()
+        try:
+            token = login()
+        except Exception as e:
+            with self._lock:
+                del self._logins[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            self._tokens[key] = (token, time.time() + ttl if ttl else None)
+            del self._logins[key]
+        future.set_result(token)
+        return token
+
+    def invalidate(self, key: tuple, token: str):
+        """
+        Discard a token the api rejected, unless it was already renewed.
+        """
+        with self._lock:
+            if self._tokens.get(key, (None,))[0] == token:
+                del self._tokens[key]
+
+
+tokens = TokenCache()
+
+
+class IntensitySeries:
+    """
+    Carbon intensity measured over time, in sorted compact arrays.
+    """
+    __slots__ = ('epochs', 'values')
+
+    def __init__(self, points=()):
+        """
+        :param points: Iterable of tuples of measurement epoch and intensity in kg/Wh, in any order
+        """
+        points = sorted(points)
+        self.epochs = array('q', [epoch for epoch, _ in points])
+        self.values = array('d', [value for _, value in points])
+
+    def __len__(self):
+        return len(self.epochs)
+
+    def at(self, epoch: int) -> float:
+        """
+        Intensity at the epoch, linearly interpolated between the measurements around it. Epochs out of the series take
+        the value of the closest end.
+        :param epoch: Time in seconds
+        :return: Intensity in kg/Wh
+        """
+        if not self.epochs:
+            raise AttributeError('Empty carbon intensity series.')
+        i = bisect_left(self.epochs, epoch)
+        if i == len(self.epochs):
+            return self.values[-1]
+        if self.epochs[i] == epoch or i == 0:
+            return self.values[i]
+        x0, x1 = self.epochs[i - 1], self.epochs[i]
+        y0, y1 = self.values[i - 1], self.values[i]
+        return y0 + (y1 - y0) * (epoch - x0) / (x1 - x0)
+
+
 class WattimeV1(CarbonEmissionAPI):
+    # day series of all clients per balancing authority and day: tuples of IntensitySeries and fetch time
+    _series = {}
+    # futures of the series being fetched, per balancing authority and day
+    _series_loading = {}
+    _series_lock = threading.Lock()
+    # days of series kept in memory
+    keep_days = 7
+    # seconds before the series of a day not over yet is fetched again
+    series_refresh = 3600
+    # series request page size
+    series_page_size = 1000
 
-    def __init__(self, usr: str, pwd: str, ba: str, hours_from_now: int = 2):
+    def __init__(self, usr: str, pwd: str, ba: str, hours_from_now: int = 2, retries: int = 3,
+                 timeout: float = None, prefetch: bool = False):
         """
         Wattime API credentials. http://watttime.org/
         :param usr: Username used for login
@@ -55,19 +269,85 @@ class WattimeV1(CarbonEmissionAPI):
         :param ba: Balancing Authority. https://api.watttime.org/tutorials/#ba
         :param hours_from_now: Hours from the current time to check for CO emission. If none provided, will \
         get current day.
+        :param retries: Retries of failed requests, with exponential backoff
+        :param timeout: Seconds to wait for the api. Session default if None.
+        :param prefetch: Read states from the day series of the balancing authority, fetched once a day
         """
         self.credentials = {'username': usr, 'password': pwd}
         self.api_url = 'https://api.watttime.org/api/v1/'
         self.ba = ba
         self.hours_from_now = hours_from_now
+        self.retries = retries
+        self.timeout = timeout
+        self.prefetch = prefetch
 
-    def read_state(self) -> CarbonEmissionData:
+    def read_state(self, measurement_epoch: int = None) -> CarbonEmissionData:
+        """
+        Reading of the balancing authority in the current hour, shared with the other clients of the process.
+        In prefetch mode or given a measurement epoch the reading is interpolated from the day series instead.
+        :param measurement_epoch: Time of the energy measurement, ie. of a backdated reading
+        """
+        if self.prefetch or measurement_epoch is not None:
+            return self.intensity_at(int(time.time()) if measurement_epoch is None else measurement_epoch)
+        return intensities.get(type(self).__name__, self.ba, self.read_api, f'hours_from_now={self.hours_from_now}')
+
+    def intensity_at(self, epoch: int) -> CarbonEmissionData:
+        """
+        Carbon intensity at the epoch interpolated from the series of its day.
+        :param epoch: Time in seconds
+        :return: CarbonEmissionData measured at the epoch
+        """
+        day = datetime.datetime.utcfromtimestamp(epoch).date()
+        series = self.day_series(day, epoch)
+        access_epoch = calendar.timegm(datetime.datetime.now().timetuple())
+        raw = {'ba': self.ba, 'day': day.isoformat(), 'interpolated': True}
+        return CarbonEmissionData(access_epoch, raw, series.at(epoch), epoch)
+
+    def day_series(self, day: datetime.date, until: int = None) -> IntensitySeries:
+        """
+        Carbon intensity series of the balancing authority in a day, fetched if missing. The series of a day not over
+        yet is fetched again when it ends before until and it is older than series_refresh seconds. Each series is
+        fetched by one client at a time, series of other days and balancing authorities in parallel.
+        :param day: UTC day
+        :param until: Epoch the series should reach
+        :return: IntensitySeries
+        """
+        key = (self.api_url, self.ba, day)
+        with self._series_lock:
+            series, fetched_at = self._series.get(key, (None, 0))
+            day_end = calendar.timegm(day.timetuple()) + 24 * 3600
+            outdated = (until is not None and series is not None and (not series or until > series.epochs[-1])
+                        and fetched_at < day_end and time.time() - fetched_at > self.series_refresh)
+            if series is not None and not outdated:
+                return series
+            future = self._series_loading.get(key)
+            leader = future is None
+            if leader:
+                future = self._series_loading[key] = Future()
+        if not leader:
+            # an outdated series is still good while another client fetches it again
+            return series if series is not None else future.result()
+        try:
+            series = IntensitySeries(self.__get_marginal_series(day))
+        except Exception as e:
+            with self._series_lock:
+                del self._series_loading[key]
+            future.set_exception(e)
+            raise
+        with self._series_lock:
+            self._series[key] = (series, time.time())
+            del self._series_loading[key]
+            for old in [k for k in self._series if k[2] < day - datetime.timedelta(days=self.keep_days)]:
+                del self._series[old]
+        future.set_result(series)
+        return series
+
+    def read_api(self) -> CarbonEmissionData:
         """
         Reach wattime api, parse and convert to CarbonEmissionData.
         """
-        auth_token = self.__get_auth_token()
-        # 2. Fetch marginal data
-        raw = self.__get_marginal(auth_token)
+        # 1 and 2. Fetch marginal data, logging in if there is no valid token
+        raw = self.__get_marginal()
         # 3. Converts lb/MW to kg/W
         accumulated_co2 = raw['marginal_carbon']['value'] * 0.453592 * pow(10, -6)
         # 4. Converts time stamps to epoch
@@ -86,7 +366,7 @@ class WattimeV1(CarbonEmissionAPI):
         :return: Access token string suitable for passing as arg in other methods.
         """
         endpoint = self.api_url + 'obtain-token-auth/'
-        r = requests.post(endpoint, data=self.credentials)
+        r = session.request('POST', endpoint, data=self.credentials, timeout=self.timeout, retries=self.retries)
         if not r.status_code == 200:
             raise AttributeError('Failed getting a new token.')
         ans = r.json()
@@ -94,10 +374,23 @@ class WattimeV1(CarbonEmissionAPI):
             raise AttributeError('Failed getting a new token.')
         return ans['token']
 
-    def __get_marginal(self, auth_token: str) -> dict:
+    def __get(self, endpoint: str, params: dict):
+        """
+        Get with the cached token, logging in again once if the api rejects it.
+        """
+        key = (self.api_url, self.credentials['username'])
+        for _ in range(2):
+            auth_token = tokens.get(key, self.__get_auth_token)
+            h = {'Authorization': 'Token ' + auth_token}
+            r = session.get(endpoint, headers=h, params=params, timeout=self.timeout, retries=self.retries)
+            if r.status_code not in UNAUTHORIZED:
+                break
+            tokens.invalidate(key, auth_token)
+        return r
+
+    def __get_marginal(self) -> dict:
         """
         Gets marginal carbon emission based on real time energy source mix of the grid.
-        :param auth_token: authentication token
         :return: Measured data in lb/MW plus other relevant raw metadata.
         """
         base_time = datetime.datetime.now()
@@ -117,8 +410,7 @@ class WattimeV1(CarbonEmissionAPI):
             'market': 'RTHR'
         }
         endpoint = self.api_url + 'marginal/'
-        h = {'Authorization': 'Token ' + auth_token}
-        r = requests.get(endpoint, headers=h, params=marginal_query)
+        r = self.__get(endpoint, marginal_query)
         ans = r.json()
         if 'count' not in ans.keys() and 'detail' in ans.keys():
             raise AttributeError('Failed to login on api.')
@@ -126,6 +418,34 @@ class WattimeV1(CarbonEmissionAPI):
             raise AttributeError('Empty response from api.')
         return ans['results'][0]
 
+    def __get_marginal_series(self, day: datetime.date):
+        """
+        Gets all marginal carbon emission measurements of a day, following the result pages.
+        :param day: UTC day
+        :return: Generator of tuples of measurement epoch and kg/Wh
+        """
+        marginal_query = {
+            'ba': self.ba,
+            'start_at': day.strftime("%Y-%m-%dT00:00:00Z"),
+            'end_at': day.strftime("%Y-%m-%dT23:59:59Z"),
+            'page_size': self.series_page_size,
+            'market': 'RTHR'
+        }
+        endpoint = self.api_url + 'marginal/'
+        while endpoint:
+            r = self.__get(endpoint, marginal_query)
+            ans = r.json()
+            if 'count' not in ans.keys() and 'detail' in ans.keys():
+                raise AttributeError('Failed to login on api.')
+            for result in ans['results']:
+                marginal = result.get('marginal_carbon') or {}
+                if marginal.get('value') is None:
+                    continue
+                timestamp = datetime.datetime.strptime(result['timestamp'], "%Y-%m-%dT%H:%M:%SZ")
+                yield calendar.timegm(timestamp.timetuple()), marginal['value'] * 0.453592 * pow(10, -6)
+            # the next link carries the query
+            endpoint, marginal_query = ans.get('next'), None
+
     def get_ba(self, lon, lat, auth_token) -> str:
         """
         Fetch Balancing Authority data based on geo spatial coordinates.
@@ -140,31 +460,43 @@ class WattimeV1(CarbonEmissionAPI):
         }
         endpoint = self.api_url + 'balancing_authorities/'
         h = {'token': auth_token}
-        r = requests.get(endpoint, headers=h, params=geo_query)
+        r = session.get(endpoint, headers=h, params=geo_query, timeout=self.timeout, retries=self.retries)
         ans = r.json()
         return ans['abbrev']
 
 
 class WattimeV2(CarbonEmissionAPI):
 
-    def __init__(self, usr: str, pwd: str, ba: str):
+    def __init__(self, usr: str, pwd: str, ba: str, retries: int = 3, timeout: float = None,
+                 token_ttl: float = 30 * 60):
         """
         Wattime API credentials. http://watttime.org/
         :param usr: Username used for login
         :param pwd: Users password
         :param ba: Balancing Authority. https://api.watttime.org/tutorials/#ba
+        :param retries: Retries of failed requests, with exponential backoff
+        :param timeout: Seconds to wait for the api. Session default if None.
+        :param token_ttl: Seconds a login token is valid
         """
         self.credentials = (usr, pwd)
         self.api_url = 'https://api2.watttime.org/v2test/'
         self.ba = ba
+        self.retries = retries
+        self.timeout = timeout
+        self.token_ttl = token_ttl
 
     def read_state(self) -> CarbonEmissionData:
+        """
+        Reading of the balancing authority in the current hour, shared with the other clients of the process.
+        """
+        return intensities.get(type(self).__name__, self.ba, self.read_api)
+
+    def read_api(self) -> CarbonEmissionData:
         """
         Reach wattime api, parse and convert to CarbonEmissionData.
         """
-        auth_token = self.__get_auth_token()
-        # 2. Fetch marginal data
-        raw = self.__get_marginal(auth_token)
+        # 1 and 2. Fetch marginal data, logging in if there is no valid token
+        raw = self.__get_marginal()
         # 3. Converts lb/MW to kg/W
         accumulated_co2 = raw['avg'] * 0.453592 * pow(10, -6)
         # 4. Converts time stamps to epoch
@@ -183,7 +515,7 @@ class WattimeV2(CarbonEmissionAPI):
         :return: Access token string suitable for passing as arg in other methods.
         """
         endpoint = self.api_url + 'login'
-        r = requests.get(endpoint, auth=self.credentials)
+        r = session.get(endpoint, auth=self.credentials, timeout=self.timeout, retries=self.retries)
         if not r.status_code == 200:
             raise AttributeError('Failed getting a new token.')
         ans = r.json()
@@ -191,18 +523,30 @@ class WattimeV2(CarbonEmissionAPI):
             raise AttributeError('Failed getting a new token.')
         return ans['token']
 
-    def __get_marginal(self, auth_token: str) -> dict:
+    def __get(self, endpoint: str, params: dict):
+        """
+        Get with the cached token, logging in again once if the api rejects it.
+        """
+        key = (self.api_url, self.credentials[0])
+        for _ in range(2):
+            auth_token = tokens.get(key, self.__get_auth_token, self.token_ttl)
+            h = {'Authorization': 'Bearer ' + auth_token}
+            r = session.get(endpoint, headers=h, params=params, timeout=self.timeout, retries=self.retries)
+            if r.status_code not in UNAUTHORIZED:
+                break
+            tokens.invalidate(key, auth_token)
+        return r
+
+    def __get_marginal(self) -> dict:
         """
         Gets marginal carbon emission based on real time energy source mix of the grid.
-        :param auth_token: authentication token
         :return: Measured data in lb/MW plus other relevant raw metadata.
         """
         marginal_query = {
             'ba': self.ba
         }
         endpoint = self.api_url + 'insight/'
-        h = {'Authorization': 'Bearer ' + auth_token}
-        r = requests.get(endpoint, headers=h, params=marginal_query)
+        r = self.__get(endpoint, marginal_query)
         if not r.status_code == 200:
             raise AttributeError('Failed to login on api.')
         return r.json()
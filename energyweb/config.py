@@ -1,15 +1,30 @@
 """
 Configuration file parser and app descriptor
 """
+import io
+import os
+import json
+import pickle
+import hashlib
+import datetime
 import importlib
+import threading
 from collections import namedtuple
 from enum import Enum
 
+from energyweb import schema
+from energyweb.dispatcher import Task
 from energyweb.carbonemission import CarbonEmissionAPI
 from energyweb.eds.interfaces import EnergyDevice
 from energyweb.smart_contract.interfaces import EVMSmartContractClient
 
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
 Module = namedtuple('Module', ['module', 'class_name', 'parameters'])
+AssetChanges = namedtuple('AssetChanges', ['added', 'removed', 'changed'])
 
 
 class MODULES(Enum):
@@ -60,10 +75,11 @@ class BondConfiguration:
         tasks:
     """
     class AppInfo:
-        def __init__(self, title: str, description: str, version: str):
+        def __init__(self, title: str, description: str, version: str, **kwargs):
             self.title = title
             self.description = description
             self.version = version
+            self.__dict__.update(kwargs)
 
     class AppConfig:
         def __init__(self, debugger: str, verbosity: str, **kwargs):
@@ -81,8 +97,8 @@ class BondConfiguration:
             raise ConfigurationFileError('Should contain at least one valid task.')
         self.energyweb = energyweb
         self.tasks = tasks
-        self.config = self.AppConfig(config)
-        self.info = self.AppInfo(info)
+        self.config = self.AppConfig(**config)
+        self.info = self.AppInfo(**info)
 
 # TODO: Refactor origin config and decide if it lives here or in origin app
 # def parse_bond_app(configuration_file_path: str) -> BondConfiguration:
@@ -107,12 +123,137 @@ class ConfigurationFileError(Exception):
     """
     Custom Exception to deal with non-conforming configuration files
     """
-    def __init__(self, msg: str = None):
+    def __init__(self, msg: str = None, errors: [str] = None):
+        """
+        :param msg: Error message
+        :param errors: Every error found in the file, one per line in the message when there is no msg
+        """
+        self.errors = errors or []
         if not msg:
-            super().__init__('Configuration file contain errors. Please provide valid Consumer and/or Producer data.')
+            msg = '\n'.join(self.errors) if self.errors else \
+                'Configuration file contain errors. Please provide valid Consumer and/or Producer data.'
         super().__init__(msg)
 
 
+SUBMODULE_SCHEMA = {
+    'module': str,
+    'class_name': str,
+    'class_parameters': dict,
+    schema.Optional('shared'): bool,
+}
+
+ASSET_SCHEMA = {
+    'name': schema.Check(str, lambda name: len(name) >= 2, 'Name must be longer than two characters.'),
+    'energy-meter': SUBMODULE_SCHEMA,
+    'smart-contract': SUBMODULE_SCHEMA,
+    schema.Optional('carbon-emission'): SUBMODULE_SCHEMA,
+}
+
+COO_V1_SCHEMA = schema.Check({
+    schema.Optional('consumers'): [ASSET_SCHEMA],
+    schema.Optional('producers'): [ASSET_SCHEMA],
+}, lambda raw: 'consumers' in raw or 'producers' in raw, 'Should contain consumers or producers.')
+
+BOND_SCHEMA = {
+    'energyweb': (str, int, float),
+    'info': {'title': str, 'description': str, 'version': (str, int, float)},
+    'config': {'debugger': (str, bool), 'verbosity': str},
+    'tasks': schema.Check([dict], lambda tasks: len(tasks) > 0, 'Should contain at least one valid task.'),
+}
+
+_coo_v1_validator = schema.compile_schema(COO_V1_SCHEMA)
+_asset_validator = schema.compile_schema(ASSET_SCHEMA)
+_bond_validator = schema.compile_schema(BOND_SCHEMA)
+
+
+def validate_coo_v1(raw_configuration_file: dict):
+    """
+    Validates a Certificate of Origin v1 configuration dictionary in one pass, including that asset names are unique.
+    :raises ConfigurationFileError: With every error found
+    """
+    errors = schema.validate(_coo_v1_validator, raw_configuration_file)
+    names = set()
+    for section in ('consumers', 'producers'):
+        items = raw_configuration_file.get(section) if isinstance(raw_configuration_file, dict) else None
+        for i, item in enumerate(items if isinstance(items, list) else []):
+            name = item.get('name') if isinstance(item, dict) else None
+            if isinstance(name, str) and name in names:
+                errors.append(f'{section}[{i}].name: {name} is not unique.')
+            names.add(name)
+    if errors:
+        raise ConfigurationFileError(errors=errors)
+
+
+def validate_bond(raw_configuration_file: dict):
+    """
+    Validates a Bond configuration dictionary in one pass.
+    :raises ConfigurationFileError: With every error found
+    """
+    errors = schema.validate(_bond_validator, raw_configuration_file)
+    if errors:
+        raise ConfigurationFileError(errors=errors)
+
+
+validate_coo_v1.fingerprint = schema.fingerprint(COO_V1_SCHEMA)
+validate_bond.fingerprint = schema.fingerprint(BOND_SCHEMA)
+
+_validated = {}
+
+
+def load_configuration_file(path: str, validator=validate_coo_v1, cache_path: str = None) -> dict:
+    """
+    Read and validate a json or yaml configuration file. Validated files are cached by digest of the content and of the
+    validator schema, in memory and in cache_path, so loading an unchanged file again skips parsing the yaml and
+    validating, until the schema changes.
+    :param path: Json file, or yaml file with the .yml or .yaml extension
+    :param validator: Function raising ConfigurationFileError on invalid configurations, ie. validate_bond
+    :param cache_path: Directory to cache validated configurations across restarts, memory only if None
+    :return: Configuration dictionary. Do not modify it, it is shared with later loads of the same content.
+    """
+    with open(path, 'rb') as file:
+        content = file.read()
+    return load_configuration(content, path.endswith(('.yml', '.yaml')), validator, cache_path)
+
+
+def load_configuration(content: bytes, is_yaml: bool = False, validator=validate_coo_v1,
+                       cache_path: str = None) -> dict:
+    """
+    Same as load_configuration_file for the content of a file already read.
+    :param content: File content
+    :param is_yaml: Parse the content as yaml instead of json
+    """
+    fingerprint = getattr(validator, 'fingerprint', validator.__qualname__)
+    digest = hashlib.sha256(fingerprint.encode() + b'\0' + content).hexdigest()
+    key = (digest, validator)
+    if key in _validated:
+        return _validated[key]
+    # pickled to keep yaml types, ie. dates and integer keys, as a fresh parse returns them
+    cached = os.path.join(cache_path, '{}.{}.pickle'.format(validator.__name__, digest)) if cache_path else None
+    if cached and os.path.exists(cached):
+        with open(cached, 'rb') as file:
+            raw = pickle.load(file)
+    else:
+        if is_yaml:
+            if not yaml:
+                raise EnvironmentError('Install PyYAML to read yaml configuration files.')
+            raw = yaml.safe_load(content)
+        else:
+            raw = json.loads(content)
+        validator(raw)
+        if cached:
+            os.makedirs(cache_path, exist_ok=True)
+            temporary = cached + '.tmp'
+            try:
+                with open(temporary, 'wb') as file:
+                    pickle.dump(raw, file, pickle.HIGHEST_PROTOCOL)
+                os.replace(temporary, cached)
+            finally:
+                if os.path.exists(temporary):
+                    os.remove(temporary)
+    _validated[key] = raw
+    return raw
+
+
 class EnergywebAppConfiguration:
     """
     Abstract class
@@ -155,24 +296,43 @@ class CooV1Configuration(EnergywebAppConfiguration):
         self.production = production
 
 
-def parse_coo_v1(raw_configuration_file: dict) -> CooV1Configuration:
+def parse_coo_v1(raw_configuration_file: dict, validate: bool = True) -> CooV1Configuration:
     """
     Read and parse Certificatate of Orign v1 (release A) configuration dictionary into structured class instances.
     :param raw_configuration_file: Configuration file parsed as a dictionary.
+    :param validate: Validate the dictionary first. Skip it only for dictionaries already validated.
     :return: Configuration instance
     """
     if not isinstance(raw_configuration_file, dict):
         raise AssertionError("Configuration json must be deserialized first.")
-    is_consuming = 'consumers' in raw_configuration_file
-    is_producing = 'producers' in raw_configuration_file
-    if not is_consuming and not is_producing:
-        raise ConfigurationFileError
-
-    consumption = [__parse_item(config) for config in raw_configuration_file['consumers']]
-    production = [__parse_item(config) for config in raw_configuration_file['producers']]
+    if validate:
+        validate_coo_v1(raw_configuration_file)
+    consumption = [__parse_item(config) for config in raw_configuration_file.get('consumers', [])]
+    production = [__parse_item(config) for config in raw_configuration_file.get('producers', [])]
     return CooV1Configuration(consumption, production)
 
 
+def parse_coo_v1_file(path: str, cache_path: str = None) -> CooV1Configuration:
+    """
+    Read, validate and parse a Certificate of Origin v1 json or yaml configuration file.
+    :param path: Configuration file path
+    :param cache_path: Directory caching validated configurations across restarts
+    :return: Configuration instance
+    """
+    raw_configuration_file = load_configuration_file(path, validate_coo_v1, cache_path)
+    return parse_coo_v1(raw_configuration_file, validate=False)
+
+
+def parse_bond(raw_configuration_file: dict) -> BondConfiguration:
+    """
+    Validate and parse a Bond configuration dictionary.
+    :param raw_configuration_file: Configuration file parsed as a dictionary.
+    :return: BondConfiguration
+    """
+    validate_bond(raw_configuration_file)
+    return BondConfiguration(**{k: raw_configuration_file[k] for k in ('energyweb', 'info', 'config', 'tasks')})
+
+
 def parse_single_asset(raw_configuration_file: dict) -> CooV1ConsumerConfiguration:
     """
     Read and parse single producer or consumer configuration dictionary into structured class instances.
@@ -181,7 +341,10 @@ def parse_single_asset(raw_configuration_file: dict) -> CooV1ConsumerConfigurati
     """
     if not isinstance(raw_configuration_file, dict):
         raise AssertionError("Configuration json must be deserialized first.")
-    configuration = __parse_item(raw_configuration_file)
+    errors = schema.validate(_asset_validator, raw_configuration_file)
+    if errors:
+        raise ConfigurationFileError(errors=errors)
+    return __parse_item(raw_configuration_file)
 
 
 def __parse_item(config_item: dict):
@@ -202,13 +365,177 @@ def __parse_item(config_item: dict):
         return CooV1ProducerConfiguration(**item)
 
 
+_classes = {}
+_instances = {}
+_instances_lock = threading.Lock()
+
+
 def __parse_instance(submodule: dict) -> object:
     """
     Reflection algorithm to dynamically load python modules referenced on the configuration json.
+    Classes are resolved once. Entries with "shared": true and the same class and parameters share one instance, ie. one
+    carbon emission api for every asset using it. Other entries get their own instance, as stateful submodules need.
     :param submodule: Configuration dict must have the keys 'module', 'class_name', 'class_parameters'.
     :return: Class instance as in task_config file.
     """
-    module_instance = importlib.import_module(submodule['module'])
-    class_obj = getattr(module_instance, submodule['class_name'])
-    class_instance = class_obj(**submodule['class_parameters'])
-    return class_instance
\ No newline at end of file
+    class_obj, instance_key = __instance_key(submodule)
+    if not submodule.get('shared', False):
+        return class_obj(**submodule['class_parameters'])
+    with _instances_lock:
+        if instance_key not in _instances:
+            _instances[instance_key] = class_obj(**submodule['class_parameters'])
+        return _instances[instance_key]
+
+
+def __instance_key(submodule: dict) -> tuple:
+    """
+    :return: Tuple of the class and the key of its shared instance
+    """
+    class_key = (submodule['module'], submodule['class_name'])
+    class_obj = _classes.get(class_key)
+    if class_obj is None:
+        module_instance = importlib.import_module(submodule['module'])
+        class_obj = _classes[class_key] = getattr(module_instance, submodule['class_name'])
+    return class_obj, (class_obj, __freeze(submodule['class_parameters']))
+
+
+def _retain_instances(raw_configuration_file: dict):
+    """
+    Forget the shared instances no asset of the configuration uses anymore.
+    """
+    keys = {__instance_key(item[key])[1] for item in _items_by_name(raw_configuration_file).values()
+            for key in ('energy-meter', 'smart-contract', 'carbon-emission') if key in item}
+    with _instances_lock:
+        for key in [k for k in _instances if k not in keys]:
+            del _instances[key]
+
+
+def __freeze(value):
+    """
+    Hashable copy of a parameter value parsed from json.
+    """
+    if isinstance(value, dict):
+        return tuple(sorted((k, __freeze(v)) for k, v in value.items()))
+    if isinstance(value, list):
+        return tuple(__freeze(item) for item in value)
+    return value
+
+
+def clear_instances():
+    """
+    Forget the shared instances, so the next parsed configuration creates new ones.
+    """
+    with _instances_lock:
+        _instances.clear()
+
+
+def _items_by_name(raw_configuration_file: dict) -> dict:
+    items = {}
+    for section in ('consumers', 'producers'):
+        for item in raw_configuration_file.get(section, []):
+            items[item['name']] = dict(item, section=section)
+    return items
+
+
+def diff_coo_v1(old_configuration_file: dict, new_configuration_file: dict) -> AssetChanges:
+    """
+    Compares two Certificate of Origin v1 configuration dictionaries asset by asset.
+    :return: AssetChanges with the lists of names of the added, removed and changed consumers and producers
+    """
+    old_items = _items_by_name(old_configuration_file)
+    new_items = _items_by_name(new_configuration_file)
+    added = [name for name in new_items if name not in old_items]
+    removed = [name for name in old_items if name not in new_items]
+    changed = [name for name in new_items if name in old_items and new_items[name] != old_items[name]]
+    return AssetChanges(added, removed, changed)
+
+
+def _parse_items(raw_configuration_file: dict, names: [str]) -> dict:
+    items = _items_by_name(raw_configuration_file)
+    return {name: __parse_item(items[name]) for name in names}
+
+
+class CooV1ConfigurationWatcher(Task):
+    """
+    Watches a Certificate of Origin v1 configuration file and reports the assets that changed.
+
+    Register it as a task of the App. On every change the callback receives the AssetChanges and the parsed
+    configurations of the added and changed assets, ie. to _replace_task and _remove_task only those. Unchanged assets
+    keep their instances, the shared ones no asset uses anymore are released. An invalid file is reported to the
+    callback as the error and the last valid configuration stays in place.
+    """
+
+    def __init__(self, queue: dict, path: str, on_change, raw_configuration_file: dict = None,
+                 polling_interval: datetime.timedelta = datetime.timedelta(seconds=10), loader=None):
+        """
+        :param queue: App queues
+        :param path: Configuration file path
+        :param on_change: Callable receiving AssetChanges, a dictionary of asset name and parsed configuration and the
+        error or None
+        :param raw_configuration_file: Configuration in use. Read from the file on the first check if None.
+        :param polling_interval: Time between checks of the file
+        :param loader: Function parsing a binary file object into a dictionary. Defaults to load_configuration, json or
+        yaml by the file extension.
+        """
+        super().__init__(queue, polling_interval, eager=True)
+        self.path = path
+        self.on_change = on_change
+        self.loader = loader
+        self.raw = raw_configuration_file
+        self._stat = None
+        self._digest = None
+
+    def check(self) -> AssetChanges:
+        """
+        Reload the file if it changed since the last check.
+        :return: AssetChanges or None when the file did not change
+        """
+        stat = os.stat(self.path)
+        stat = (stat.st_mtime_ns, stat.st_size)
+        if stat == self._stat:
+            return None
+        with open(self.path, 'rb') as file:
+            content = file.read()
+        digest = hashlib.sha1(content).digest()
+        if digest == self._digest:
+            self._stat = stat
+            return None
+        # parse the bytes hashed, the file may have changed again since
+        try:
+            if self.loader:
+                raw = self.loader(io.BytesIO(content))
+                validate_coo_v1(raw)
+            else:
+                raw = load_configuration(content, self.path.endswith(('.yml', '.yaml')), validate_coo_v1)
+        except Exception:
+            # the content stays invalid until the file changes
+            self._stat, self._digest = stat, digest
+            raise
+        changes = diff_coo_v1(self.raw, raw) if self.raw is not None else None
+        if not changes or not any(changes):
+            self.raw = raw
+            self._stat, self._digest = stat, digest
+            return None
+        try:
+            configurations = _parse_items(raw, changes.added + changes.changed)
+        except Exception as e:
+            # ie. a module failing to load, tried again on the next check
+            self.on_change(changes, {}, e)
+            return None
+        self.raw = raw
+        self.on_change(changes, configurations, None)
+        _retain_instances(raw)
+        self._stat, self._digest = stat, digest
+        return changes
+
+    async def _prepare(self):
+        pass
+
+    async def _main(self, *args):
+        self.check()
+
+    async def _finish(self):
+        pass
+
+    def _handle_exception(self, e: Exception):
+        self.on_change(AssetChanges([], [], []), {}, e)
@@ -1,90 +1,163 @@
 import logging
 
 import elasticsearch as es
+from elasticsearch import helpers
 
-from tasks.database import dao
-from tasks.ocpp16.protocol import ChargingStation
+from energyweb.database import dao
 
 
 class ElasticSearchDAO(dao.DAO):
+    """
+    Writes do not refresh the index. Searches refresh it first only when something was written since the last refresh,
+    so they still see every write. Retrieving by id is realtime and never refreshes.
+    """
 
-    def __init__(self, id_att_name: str, cls: dao.Model, *service_urls: str):
+    def __init__(self, id_att_name: str, cls: dao.Model, *service_urls: str, buffer_size: int = 500,
+                 page_size: int = 1000):
         """
         :param id_att_name: Class id attribute name
         :param cls: Class to instantiate
         :param service_urls: i.e. 'http://localhost:9200', 'https://remotehost:9000'
+        :param buffer_size: Number of objects buffered by create_many and update_many before a bulk request
+        :param page_size: Number of hits fetched per request when iterating over results
         """
         self._index = id_att_name
         self._cls = cls
         self._doc_type = cls.__name__
         self._db = es.Elasticsearch(service_urls)
+        self._buffer = []
+        self._buffer_size = buffer_size
+        self._page_size = page_size
+        self._dirty = False
         # suppress warnings
         es_logger = logging.getLogger('elasticsearch')
         es_logger.setLevel(logging.ERROR)
 
     def create(self, obj: dao.Model):
-        res = self._db.index(index=self._index, doc_type=self._doc_type, body=obj.to_dict(), id=obj.reg_id,
-                             refresh=True)
+        # buffered writes go first, so they don't overwrite this one
+        self.flush()
+        res = self._db.index(index=self._index, doc_type=self._doc_type, body=obj.to_dict(), id=obj.reg_id)
+        self._dirty = True
         if not res['result'] in ('created', 'updated'):
             raise es.ElasticsearchException('Fail creating or updating the object in the database')
 
-    def retrieve(self, _id):
+    def create_many(self, objs: [dao.Model]):
+        """
+        Buffer objects to index with bulk requests of buffer_size objects. Call flush to send the rest.
+        Every object is buffered or sent even when a request fails. Objects that failed to index stay in the buffer and
+        are reported in one error at the end.
+        :param objs: Iterable of objects
+        :raises BulkIndexError: With the errors of every bulk request, when some objects failed to index
+        """
+        failed, errors, error = [], [], None
+        for obj in objs:
+            self._buffer.append({'_index': self._index, '_type': self._doc_type, '_id': obj.reg_id,
+                                 '_source': obj.to_dict()})
+            if error is None and len(self._buffer) >= self._buffer_size:
+                try:
+                    self.flush()
+                except helpers.BulkIndexError as e:
+                    errors.extend(e.errors)
+                    failed.extend(self._buffer)
+                    self._buffer = []
+                except Exception as e:
+                    # the database is unreachable, buffer the rest for the next flush
+                    error = e
+        self._buffer[:0] = failed
+        if error is not None:
+            raise error
+        if errors:
+            raise helpers.BulkIndexError(f'{len(errors)} document(s) failed to index.', errors)
+
+    def update_many(self, objs: [dao.Model]):
+        self.create_many(objs)
+
+    def flush(self):
+        """
+        Send the buffered objects in one bulk request. Objects that failed to index stay in the buffer to be sent again
+        by the next flush, every object does if the request failed.
+        :raises BulkIndexError: When some objects failed to index
+        """
+        if not self._buffer:
+            return
+        self._dirty = True
+        _, errors = helpers.bulk(self._db, self._buffer, raise_on_error=False)
+        failed = {item['_id'] for error in errors for item in error.values()}
+        self._buffer = [action for action in self._buffer if action['_id'] in failed]
+        if errors:
+            raise helpers.BulkIndexError(f'{len(errors)} document(s) failed to index.', errors)
+
+    def refresh(self):
+        """
+        Send the buffered objects and make every write visible to searches.
+        """
+        self.flush()
         self._db.indices.refresh(self._index)
+        self._dirty = False
+
+    def retrieve(self, _id):
+        self.flush()
         res = self._db.get(self._index, self._doc_type, id=_id)
         if not res['found']:
             raise es.ElasticsearchException('Object not found.')
-        obj = self._cls.from_dict(res['_source'])
-        obj.reg_id = res['_id']
-        return obj
+        return self._to_obj(res)
 
     def retrieve_all(self):
-        self._db.indices.refresh(self._index)
-        res = self._db.search(self._index, self._doc_type, body={"query": {"match_all": {}}})
-        objs = []
-        for hit in res['hits']['hits']:
-            obj = self._cls.from_dict(hit['_source'])
-            obj.reg_id = hit['_id']
-            objs.append(obj)
-        return objs
+        return list(self.iter_query({"match_all": {}}, preserve_order=False))
 
     def update(self, obj: dao.Model):
         self.create(obj)
 
     def delete(self, obj: dao.Model):
+        self.flush()
         response = self._db.delete(index=self._index, doc_type=self._doc_type, id=obj.reg_id)
+        self._dirty = True
         if not response['result'] == 'deleted':
             raise es.ElasticsearchException('Object not found.')
 
     def find_by(self, attributes: [dict]) -> [dict]:
-        self._db.indices.refresh(self._index)
-        query = {"query": {"bool": {"must": [{"match": {k: attributes[k]}} for k in attributes]}}}
-        res = self._db.search(self._index, self._doc_type, body=query)
-        objs = []
-        for hit in res['hits']['hits']:
-            obj = self._cls.from_dict(hit['_source'])
-            obj.reg_id = hit['_id']
-            objs.append(obj)
-        return objs
+        return list(self.iter_query({"bool": {"must": [{"match": {k: attributes[k]}} for k in attributes]}}))
 
     def delete_all(self):
+        self._refresh_if_dirty()
         self._db.delete_by_query(self._index, doc_type=self._doc_type, body={"query": {"match_all": {}}})
+        self._dirty = True
 
     def delete_all_blank(self, field: str):
-        self._db.delete_by_query(self._index, doc_type=self._doc_type, body={"bool": {"must_not": {"exists": {"field": field}}}})
+        self._refresh_if_dirty()
+        self._db.delete_by_query(self._index, doc_type=self._doc_type,
+                                 body={"query": {"bool": {"must_not": {"exists": {"field": field}}}}})
+        self._dirty = True
 
     def query(self, query: dict) -> [dict]:
         """
         :param query: https://www.elastic.co/guide/en/elasticsearch/reference/5.6/query-filter-context.html
         :return: dict
         """
-        self._db.indices.refresh(self._index)
-        res = self._db.search(self._index, self._doc_type, body={"query": query})
-        objs = []
-        for hit in res['hits']['hits']:
-            obj = self._cls.from_dict(hit['_source'])
-            obj.reg_id = hit['_id']
-            objs.append(obj)
-        return objs
+        return list(self.iter_query(query))
+
+    def iter_query(self, query: dict, preserve_order: bool = True):
+        """
+        Iterate over every hit of the query, fetching page_size hits per request with the scroll api.
+        :param query: https://www.elastic.co/guide/en/elasticsearch/reference/5.6/query-filter-context.html
+        :param preserve_order: Return hits by relevance, like a search. Otherwise in index order, which is cheaper to
+        scroll for queries where relevance doesn't matter.
+        :return: Generator of objects
+        """
+        self._refresh_if_dirty()
+        hits = helpers.scan(self._db, query={"query": query}, index=self._index, doc_type=self._doc_type,
+                            size=self._page_size, preserve_order=preserve_order)
+        for hit in hits:
+            yield self._to_obj(hit)
+
+    def _refresh_if_dirty(self):
+        if self._buffer or self._dirty:
+            self.refresh()
+
+    def _to_obj(self, hit: dict):
+        obj = self._cls.from_dict(hit['_source'])
+        obj.reg_id = hit['_id']
+        return obj
 
 
 class ElasticSearchDAOFactory(dao.DAOFactory):
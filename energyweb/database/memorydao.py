@@ -1,66 +1,145 @@
-from copy import deepcopy
+import datetime
+from copy import copy, deepcopy
 
-import tasks.database.dao as dao
+import energyweb.database.dao as dao
+
+_MISSING = object()
+# attribute types shared between the stored snapshot and the copies read
+_IMMUTABLE = frozenset((type(None), bool, int, float, complex, str, bytes, datetime.datetime, datetime.date))
 
 
 class MemoryDAO(dao.DAO):
     """
     Store values in memory instead of any persistence
     Usually used in tests as a test fixture to raise coverage
+
+    Objects are copied once when written. Reads return copies of the stored snapshot sharing only its immutable
+    attribute values, so modifying a returned object never changes the store. Attributes declared as indexes are looked
+    up in hash indexes by find_by.
     """
 
-    def __init__(self):
+    def __init__(self, indexes: [str] = (), copy_on_read: bool = True):
+        """
+        :param indexes: Attribute names to index for find_by. Other attributes are found by scanning.
+        :param copy_on_read: Return copies of the stored objects. When disabled the stored objects are returned, they
+        must not be modified other than to update them right after.
+        """
         dao.DAO.register(MemoryDAO)
         self._stack = {}
+        self._indexes = {attribute: {} for attribute in indexes}
+        # indexed values of each stored object, the stored object itself may be modified when not copied on read
+        self._indexed = {}
+        self._read = _detached if copy_on_read else _same
 
     def cls(self, obj):
         return obj.__class__.__name__
 
     def create(self, obj):
-        self._stack[obj.reg_id] = deepcopy(obj)
+        snapshot = deepcopy(obj)
+        if obj.reg_id in self._stack:
+            self._unindex(obj.reg_id)
+        self._stack[obj.reg_id] = snapshot
+        self._index(snapshot)
 
     def retrieve(self, reg_id):
         if reg_id not in self._stack.keys():
             raise FileNotFoundError
-        obj = self._stack[reg_id]
-        return deepcopy(obj)
+        return self._read(self._stack[reg_id])
 
     def retrieve_all(self):
-        return [deepcopy(self._stack[i]) for i in self._stack]
+        return [self._read(obj) for obj in self._stack.values()]
 
     def update(self, obj):
         if obj.reg_id in self._stack.keys():
-            self._stack[obj.reg_id] = deepcopy(obj)
+            self.create(obj)
         else:
             raise FileNotFoundError
 
     def delete(self, obj):
-        del self._stack[obj.reg_id]
+        self._stack.pop(obj.reg_id)
+        self._unindex(obj.reg_id)
 
     def find_by(self, attributes: dict):
-        result = []
-        if len(self._stack) == 0:
-            return result
-        sample = list(self._stack.items())[0][1]
-        intersect_keys = set(attributes).intersection(set(sample.__dict__))
-        for k, reg in self._stack.items():
-            for key in intersect_keys:
-                stack_item = reg.__dict__
-                if stack_item[key] == attributes[key]:
-                    result.append(deepcopy(reg))
+        """
+        Objects matching every attribute value.
+        :param attributes: Attribute names and values
+        :return: List of objects in the order they were stored
+        """
+        if not attributes:
+            raise FileNotFoundError
+        indexed = [k for k in attributes if k in self._indexes]
+        if indexed:
+            matches = [self._lookup(k, attributes[k]) for k in indexed]
+            matches.sort(key=len)
+            reg_ids = [reg_id for reg_id in matches[0] if all(reg_id in m for m in matches[1:])]
+            candidates = (self._stack[reg_id] for reg_id in reg_ids)
+        else:
+            candidates = self._stack.values()
+        # indexed attributes are checked again in case a stored object was modified since it was indexed
+        result = [self._read(obj) for obj in candidates
+                  if all(getattr(obj, k, _MISSING) == v for k, v in attributes.items())]
         if len(result) < 1:
             raise FileNotFoundError
         return result
 
+    def _lookup(self, attribute: str, value) -> dict:
+        index = self._indexes[attribute]
+        try:
+            return index.get(value, {})
+        except TypeError:
+            # unhashable value, ie. a list
+            return {reg_id: None for reg_id, obj in self._stack.items()
+                    if getattr(obj, attribute, _MISSING) == value}
+
+    def _index(self, obj):
+        values = {}
+        for attribute, index in self._indexes.items():
+            value = getattr(obj, attribute, _MISSING)
+            try:
+                index.setdefault(value, {})[obj.reg_id] = None
+            except TypeError:
+                continue
+            values[attribute] = value
+        self._indexed[obj.reg_id] = values
+
+    def _unindex(self, reg_id):
+        for attribute, value in self._indexed.pop(reg_id, {}).items():
+            index = self._indexes[attribute]
+            reg_ids = index[value]
+            reg_ids.pop(reg_id, None)
+            if not reg_ids:
+                del index[value]
+
+
+def _same(obj):
+    return obj
+
+
+def _detached(obj):
+    """
+    Copy of the object with its own copy of every mutable attribute value.
+    """
+    if not hasattr(obj, '__dict__'):
+        return deepcopy(obj)
+    result = copy(obj)
+    for name, value in list(vars(result).items()):
+        if type(value) not in _IMMUTABLE:
+            setattr(result, name, deepcopy(value))
+    return result
+
 
 class MemoryDAOFactory(dao.DAOFactory):
 
-    def __init__(self):
+    def __init__(self, indexes: dict = None):
+        """
+        :param indexes: Attribute names to index per model class
+        """
         super().__init__()
         self.__instances = {}
+        self.__indexes = indexes or {}
 
     def get_instance(self, cls) -> MemoryDAO:
         if id(cls) in list(self.__instances.keys()):
             return self.__instances[id(cls)]
-        self.__instances[id(cls)] = MemoryDAO()
+        self.__instances[id(cls)] = MemoryDAO(self.__indexes.get(cls, ()))
         return self.__instances[id(cls)]
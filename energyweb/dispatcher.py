@@ -63,12 +63,17 @@ class Task:
                 await main_loop()
                 while self.run_forever:
                     await main_loop()
+            except asyncio.CancelledError:
+                # removed from the app, not an error
+                raise
             except Exception as e:
                 self._handle_exception(e)
             finally:
                 await self._finish()
                 if self.run_forever:
                     await self.run(*args)
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
             self._handle_exception(e)
 
@@ -81,6 +86,9 @@ class App:
         self.tasks: [asyncio.tasks] = []
         self.queue: {str: asyncio.Queue} = {}
         self.loop = asyncio.get_event_loop()
+        self._named_tasks = {}
+        self._running = {}
+        self._started = None
         self._configure()
 
     def _configure(self):
@@ -101,13 +109,72 @@ class App:
         """
         raise NotImplementedError
 
-    def _register_task(self, task: Task, *args):
+    def _register_task(self, task: Task, *args, name: str = None):
         """
-        Add task to be executed in run time
+        Add task to be executed in run time. Tasks registered while the app runs start right away.
+        :param name: Name to remove or replace the task later, ie. the asset name
         """
         if not task:
             raise Exception('Please add a Task type with callable task named method.')
-        self.tasks.append((task, args))
+        if name in self._named_tasks:
+            raise ValueError(f'Task {name} already registered.')
+        entry = (task, args)
+        self.tasks.append(entry)
+        if name:
+            self._named_tasks[name] = entry
+        if self.loop.is_running():
+            self._start(entry)
+
+    def _remove_task(self, name: str) -> Task:
+        """
+        Stop a named task, running its finish step, and remove it. The other tasks and the queues are not affected.
+        :param name: Name given on registration
+        :return: Removed task
+        """
+        entry = self._named_tasks.pop(name)
+        # by identity, tasks may compare equal
+        del self.tasks[next(i for i, e in enumerate(self.tasks) if e is entry)]
+        task, _ = entry
+        task.run_forever = False
+        future = self._running.pop(id(entry), None)
+        if future:
+            future.cancel()
+        return task
+
+    def _replace_task(self, name: str, task: Task, *args):
+        """
+        Stop the named task, if any, and register the new one under the same name.
+        """
+        if name in self._named_tasks:
+            self._remove_task(name)
+        self._register_task(task, *args, name=name)
+
+    def _start(self, entry: tuple):
+        task, args = entry
+        self._running[id(entry)] = asyncio.ensure_future(task.run(*args))
+        if self._started:
+            self._started.set()
+
+    async def _run_tasks(self):
+        """
+        Run the registered tasks until all of them finish. Removed tasks are cancelled, errors of the others are raised.
+        """
+        # set when a task starts, to wait for it too
+        self._started = asyncio.Event()
+        for entry in self.tasks:
+            self._start(entry)
+        while self._running:
+            self._started.clear()
+            started = asyncio.ensure_future(self._started.wait())
+            done, _ = await asyncio.wait(list(self._running.values()) + [started], return_when=asyncio.FIRST_COMPLETED)
+            started.cancel()
+            done.discard(started)
+            for key, future in list(self._running.items()):
+                if future in done:
+                    del self._running[key]
+            for future in done:
+                if not future.cancelled() and future.exception():
+                    raise future.exception()
 
     def _register_queue(self, queue_id: str, max_size: int = 0):
         """
@@ -122,7 +189,7 @@ class App:
         execute all tasks in task list in their own thread
         """
         try:
-            self.loop.run_until_complete(asyncio.gather(*[task.run(*args) for task, args in self.tasks]))
+            self.loop.run_until_complete(self._run_tasks())
         except KeyboardInterrupt:
             self._clean_up()
             if self.loop.is_running():
@@ -3,16 +3,31 @@ Interface for the Bond API
 - Bond API delivers prosumer data
 """
 import calendar
+import contextlib
 import datetime
 import json
-import requests
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-from energyweb.eds.interfaces import EnergyDevice, EnergyData
+from energyweb.eds import session
+from energyweb.eds.interfaces import EnergyDevice, EnergyData, EnergyDataBatch, device_metadata
+
+
+def _measurement_time(measurement: dict) -> datetime.datetime:
+    return datetime.datetime.strptime(measurement['measurement_time'], "%Y-%m-%dT%H:%M:%S%z")
+
+
+def _epoch(measurement_time: datetime.datetime) -> int:
+    """
+    Measurement epoch of read_state and backfill alike, from the time as written by the api, like the access epoch.
+    """
+    return calendar.timegm(measurement_time.timetuple())
 
 
 class BondAPIv1(EnergyDevice):
 
-    def __init__(self, base_url, source, device_id, user=None, password=None):
+    def __init__(self, base_url, source, device_id, user=None, password=None, page_size=10, raw_path=None,
+                 skip_unchanged=False):
         """
         Bond api spec v1.x module
 
@@ -21,12 +36,24 @@ class BondAPIv1(EnergyDevice):
         :param device_id: Please mind it will be url encoded.
         :param user: User credential.
         :param password: Password for basic authentication method.
+        :param page_size: Number of measurements requested per page.
+        :param raw_path: Folder to write the raw pages to. EnergyData.raw then lists the file names instead of the pages.
+        :param skip_unchanged: read_state returns None when there is no measurement newer than the last one read.
+        Accumulated devices then only request the measurements after the last one read.
         """
         if source not in ('produced', 'consumed'):
             raise AssertionError
         self.base_url = base_url
         self.api_url = '{}/{}/{}'.format(base_url, source, device_id)
         self.auth = (user, password)
+        self.page_size = page_size
+        self.raw_path = raw_path
+        self.file_prefix = '{}-{}'.format(source, device_id)
+        self.skip_unchanged = skip_unchanged
+        self._last_measurement_time = None
+        self._last_is_accumulated = False
+        if raw_path:
+            os.makedirs(raw_path, exist_ok=True)
         super().__init__(
             manufacturer='Slock.it',
             model='Virtual Energy Meter',
@@ -36,52 +63,164 @@ class BondAPIv1(EnergyDevice):
         # TODO get from device metadata from API call
 
     def read_state(self, start=None, end=None) -> EnergyData:
-        # raw
-        raw, data, measurement_list = self._reach_source(self.api_url, start, end)
+        # delta fetch, accumulated readings only need the newest measurement
+        delta = self.skip_unchanged and not start and self._last_is_accumulated and self._last_measurement_time
+        if delta:
+            start = self._last_measurement_time + datetime.timedelta(seconds=1)
+        # access_epoch
+        now = datetime.datetime.now().astimezone()
+        access_epoch = calendar.timegm(now.timetuple())
+        # raw pages are streamed, only the aggregates are kept
+        raw = []
+        device_meta = None
+        energy_sum = 0
+        last_measurement = None
+        for page_number, (raw_page, data) in enumerate(self._pages(start, end)):
+            raw.append(self._store_page(raw_page, access_epoch, page_number) if self.raw_path else raw_page)
+            device_meta = data['device']
+            for measurement in data['measuredEnergy']:
+                energy_sum += measurement['energy']
+                last_measurement = measurement
+        if not last_measurement:
+            if delta:
+                return None
+            raise EnvironmentError('No measurements in the requested period.')
+        measurement_time = _measurement_time(last_measurement)
+        if self.skip_unchanged:
+            if measurement_time == self._last_measurement_time:
+                return None
+            self._last_measurement_time = measurement_time
+            self._last_is_accumulated = device_meta['is_accumulated']
         # device
-        device_meta = data[-1]['device']
-        device = EnergyDevice(**device_meta)
+        device = device_metadata(**device_meta)
         # accumulated energy in Wh
         if device.is_accumulated:
-            energy = self.to_wh(measurement_list[-1]['energy'], device.energy_unit)
+            energy = self.to_wh(last_measurement['energy'], device.energy_unit)
         else:
-            energy = self.to_wh(sum(i['energy'] for i in measurement_list), device.energy_unit)
-        # access_epoch
-        now = datetime.datetime.now().astimezone()
-        access_epoch = calendar.timegm(now.timetuple())
+            energy = self.to_wh(energy_sum, device.energy_unit)
         #  measurement epoch
-        measurement_time = datetime.datetime.strptime(measurement_list[-1]['measurement_time'], "%Y-%m-%dT%H:%M:%S%z")
-        measurement_epoch = calendar.timegm(measurement_time.timetuple())
+        measurement_epoch = _epoch(measurement_time)
         return EnergyData(device=device, access_epoch=access_epoch, raw=raw, energy=energy,
                           measurement_epoch=measurement_epoch)
 
     def write_state(self, *args, **kwargs) -> EnergyData:
         raise NotImplementedError
 
-    def _reach_source(self, url, start=None, end=None, have_next=False) -> (str, dict):
-        marginal_query = None
-        if not have_next:
-            # calculate the current time and one hour back from there
-            end_date = datetime.datetime.now(datetime.timezone.utc) if not end else end
-            start_date = end_date - datetime.timedelta(hours=1, minutes=15) if not start else start
-            marginal_query = {
-                'start': start_date.astimezone().isoformat(),  # expects year-month-day
-                'end': end_date.isoformat(),  # the hour of day
-                'limit': 10
-            }
-        http_packet = requests.get(url=url, params=marginal_query, auth=self.auth)
-        raw = http_packet.content.decode()
+    def backfill(self, start: datetime.datetime, end: datetime.datetime,
+                 window: datetime.timedelta = datetime.timedelta(hours=6), workers: int = 4,
+                 checkpoint: str = None) -> EnergyDataBatch:
+        """
+        Import a long period of readings by splitting it in windows fetched in parallel.
+        Measurements are merged and deduplicated by measurement time.
+        :param start: Start of the period, timezone aware
+        :param end: End of the period, timezone aware
+        :param window: Length of each window requested to the api
+        :param workers: Maximum number of windows fetched at once
+        :param checkpoint: Json lines file the finished windows are appended to. An interrupted backfill with the same file
+        resumes.
+        :return: Batch of the measurements sorted by measurement time, energy in Wh
+        """
+        windows = []
+        window_start = start
+        while window_start < end:
+            window_end = min(window_start + window, end)
+            windows.append((window_start.isoformat(), window_end.isoformat()))
+            window_start = window_end
+        done = self._load_checkpoint(checkpoint) if checkpoint else {}
+        pending = [w for w in windows if '/'.join(w) not in done]
+        with ThreadPoolExecutor(max_workers=workers) as executor, \
+                (open(checkpoint, 'a') if checkpoint else contextlib.nullcontext()) as file:
+            futures = {executor.submit(self._fetch_window, *w): w for w in pending}
+            for future in as_completed(futures):
+                key = '/'.join(futures[future])
+                done[key] = future.result()
+                if file:
+                    file.write(json.dumps({'window': key, **done[key]}) + '\n')
+                    file.flush()
+        # access_epoch
+        now = datetime.datetime.now().astimezone()
+        access_epoch = calendar.timegm(now.timetuple())
+        device = None
+        measurements = {}
+        for key in ('/'.join(w) for w in windows):
+            if not done[key]['device']:
+                continue
+            device = device_metadata(**done[key]['device'])
+            for measurement in done[key]['measuredEnergy']:
+                measurement_epoch = _epoch(_measurement_time(measurement))
+                measurements[measurement_epoch] = self.to_wh(measurement['energy'], device.energy_unit)
+        ordered = sorted(measurements)
+        return EnergyDataBatch(device=device, access_epoch=access_epoch, measurement_epochs=ordered,
+                               energies=[measurements[epoch] for epoch in ordered])
+
+    def _fetch_window(self, start: str, end: str) -> dict:
+        """
+        :return: Device metadata of the last page and measurements of all pages of the window
+        """
+        device_meta = None
+        measurement_list = []
+        for _, data in self._pages(datetime.datetime.fromisoformat(start), datetime.datetime.fromisoformat(end)):
+            device_meta = data['device']
+            measurement_list.extend(data['measuredEnergy'])
+        return {'device': device_meta, 'measuredEnergy': measurement_list}
+
+    @staticmethod
+    def _load_checkpoint(checkpoint: str) -> dict:
+        """
+        :return: Finished windows of the checkpoint file by window key
+        """
+        done = {}
+        if not os.path.exists(checkpoint):
+            return done
+        with open(checkpoint) as file:
+            for line in file:
+                try:
+                    window = json.loads(line)
+                except ValueError:
+                    # last line cut by an interruption, the window is fetched again
+                    continue
+                done[window.pop('window')] = window
+        return done
+
+    def _pages(self, start=None, end=None):
+        """
+        Iterate over the pages of measurements, following the next links.
+        :param start: Start of the period, defaults to one hour and fifteen minutes before end
+        :param end: End of the period, defaults to now
+        :return: Generator of tuples of raw page string and parsed page
+        """
+        # calculate the current time and one hour back from there
+        end_date = datetime.datetime.now(datetime.timezone.utc) if not end else end
+        start_date = end_date - datetime.timedelta(hours=1, minutes=15) if not start else start
+        url = self.api_url
+        params = {
+            'start': start_date.astimezone().isoformat(),  # expects year-month-day
+            'end': end_date.isoformat(),  # the hour of day
+            'limit': self.page_size
+        }
+        while url:
+            raw, data = self._reach_source(url, params)
+            yield raw, data
+            url = self.base_url + data['next'] if data.get('next') else None
+            # next links already carry the query
+            params = None
+
+    def _reach_source(self, url, params=None) -> (str, dict):
+        """
+        Fetch a single page.
+        :return: Raw page string and parsed page
+        """
+        http_packet = session.get(url, params=params, auth=self.auth, timeout=self.timeout)
         if not http_packet.ok:
             raise EnvironmentError
-        data = http_packet.json()
-        return self._parse_source(raw, data)
+        raw = http_packet.content.decode()
+        return raw, json.loads(raw)
 
-    def _parse_source(self, raw: str, data: dict):
-        measurement_list = data['measuredEnergy']
-        if 'next' in data and data['next']:
-            _, __, ___ = self._reach_source(self.base_url + data['next'], have_next=True)
-            return tuple(x + y for x, y in zip(([raw], [data], measurement_list), (_, __, ___)))
-        return [raw], [data], measurement_list
+    def _store_page(self, raw: str, access_epoch: int, page_number: int) -> str:
+        file_name = os.path.join(self.raw_path, '{}-{}-{}.json'.format(self.file_prefix, access_epoch, page_number))
+        with open(file_name, 'w') as file:
+            file.write(raw)
+        return file_name
 
 
 # TODO: Add Tox tests for this module
@@ -90,13 +229,12 @@ class BondAPIv1TestDevice1(BondAPIv1):
     Data parsing test fixture
     """
 
-    def _reach_source(self, url, start=None, end=None, have_next=False) -> (str, dict):
+    def _reach_source(self, url, params=None) -> (str, dict):
         raw = {
             "base_url/produced/0": '{"count": 0, "previous": null, "next": "/second", "device": {"manufacturer": "Siemens", "model": "ABC-123", "serial_number": "345345345", "latitude": "54.443567", "longitude": "-23.312543", "energy_unit": "kilowatt_hour", "is_accumulated": true }, "measuredEnergy": [{"energy": 100, "measurement_time": "2018-03-15T10:30:00+00:00"}, {"energy": 200, "measurement_time": "2018-03-15T12:30:00+00:00"}, {"energy": 250, "measurement_time": "2018-03-15T14:30:00+00:00"} ] }',
             "base_url/second": '{"count": 1, "previous": "first", "next": null, "device": {"manufacturer": "Siemens", "model": "ABC-123", "serial_number": "345345345", "latitude": "54.443567", "longitude": "-23.312543", "energy_unit": "kilowatt_hour", "is_accumulated": true }, "measuredEnergy": [{"energy": 390, "measurement_time": "2018-03-15T16:30:00+00:00"}, {"energy": 400, "measurement_time": "2018-03-15T18:30:00+00:00"} ] }'
         }
-        data = json.loads(raw[url])
-        return self._parse_source(str(raw), data)
+        return raw[url], json.loads(raw[url])
 
 
 class BondAPIv1TestDevice2(BondAPIv1):
@@ -104,13 +242,12 @@ class BondAPIv1TestDevice2(BondAPIv1):
     Data parsing test fixture
     """
 
-    def _reach_source(self, url, start=None, end=None, have_next=False) -> (str, dict):
+    def _reach_source(self, url, params=None) -> (str, dict):
         raw = {
             "base_url/produced/0": '{"count": 0, "previous": null, "next": "/second", "device": {"manufacturer": "Siemens", "model": "ABC-123", "serial_number": "345345345", "latitude": "54.443567", "longitude": "-23.312543", "energy_unit": "watt_hour", "is_accumulated": false }, "measuredEnergy": [{"energy": 12304, "measurement_time": "2018-03-15T10:30:00+00:00"}, {"energy": 8568, "measurement_time": "2018-03-15T12:30:00+00:00"}, {"energy": 63456, "measurement_time": "2018-03-15T14:30:00+00:00"} ] }',
             "base_url/second": '{"count": 1, "previous": "/first", "next": null, "device": {"manufacturer": "Siemens", "model": "ABC-123", "serial_number": "345345345", "latitude": "54.443567", "longitude": "-23.312543", "energy_unit": "watt_hour", "is_accumulated": false }, "measuredEnergy": [{"energy": 0, "measurement_time": "2018-03-15T16:30:00+00:00"}, {"energy": 265, "measurement_time": "2018-03-15T18:30:00+00:00"} ] }'
         }
-        data = json.loads(raw[url])
-        return self._parse_source(str(raw), data)
+        return raw[url], json.loads(raw[url])
 
 
 class BondAPIv1TestDevice3(BondAPIv1):
@@ -118,12 +255,11 @@ class BondAPIv1TestDevice3(BondAPIv1):
     Data parsing test fixture
     """
 
-    def _reach_source(self, url, start=None, end=None, have_next=False) -> (str, dict):
+    def _reach_source(self, url, params=None) -> (str, dict):
         raw = {
             "base_url/produced/0": '{"count": 0, "previous": null, "next": null, "device": {"manufacturer": "Siemens", "model": "ABC-123", "serial_number": "345345345", "latitude": "54.443567", "longitude": "-23.312543", "energy_unit": "megawatt_hour", "is_accumulated": false }, "measuredEnergy": [{"energy": 12304, "measurement_time": "2018-03-15T10:30:00+00:00"}, {"energy": 8568, "measurement_time": "2018-03-15T12:30:00+00:00"}, {"energy": 6, "measurement_time": "2018-03-15T14:30:00+00:00"} ] }'
         }
-        data = json.loads(raw[url])
-        return self._parse_source(str(raw), data)
+        return raw[url], json.loads(raw[url])
 
 
 if __name__ == '__main__':
@@ -4,11 +4,96 @@ input.eumel
 Library containing the implementations of Eumel DataLogger integration classes
 """
 import time
-import requests
 
-from xml.etree import ElementTree
-from energyweb.eds import EnergyUnit, EnergyData
-from energyweb.eds.interfaces import EnergyDevice
+from xml.parsers import expat
+from energyweb.eds import session
+from energyweb.eds.interfaces import EnergyUnit, EnergyData, EnergyDevice, device_metadata
+
+
+class EumelParser:
+    """
+    Streaming parser of Eumel SunSpec xml payloads.
+    Reads the device header and the values of the required fields of one model, then stops without parsing the rest
+    of the document. Only start tags and the text of the required fields reach python code.
+    """
+
+    class _Done(Exception):
+        pass
+
+    def __init__(self, model_id: str, fields: (str,)):
+        """
+        :param model_id: Id attribute of the model element holding the fields, ie. 211 for the meter model
+        :param fields: Id attributes of the point elements to read
+        """
+        self.model_id = model_id
+        self.fields = frozenset(fields)
+
+    def parse_header(self, raw: str) -> dict:
+        """
+        :param raw: Xml payload
+        :return: Attributes of the device element, parsing only up to it
+        """
+        header = {}
+
+        def start(tag, attributes):
+            if tag == 'd':
+                header.update(attributes)
+                raise self._Done
+
+        parser = expat.ParserCreate()
+        parser.StartElementHandler = start
+        try:
+            parser.Parse(raw, True)
+        except self._Done:
+            return header
+        raise ValueError('Eumel payload misses the device element.')
+
+    def parse(self, raw: str) -> (dict, dict):
+        """
+        :param raw: Xml payload
+        :return: Attributes of the device element and a dictionary of field id and text
+        """
+        model_id, fields = self.model_id, self.fields
+        header = {}
+        values = {}
+        in_model = False
+        field = None
+
+        def start(tag, attributes):
+            nonlocal in_model, field
+            if tag == 'p':
+                point = attributes.get('id')
+                field = point if in_model and point in fields else None
+            elif tag == 'm':
+                in_model = attributes.get('id') == model_id
+                field = None
+            elif tag == 'd':
+                header.update(attributes)
+
+        def text(data):
+            nonlocal field
+            if field is None:
+                return
+            # buffered text runs until the next start tag, including the whitespace after the closing tag
+            values[field] = data.strip()
+            field = None
+            if len(values) == len(fields):
+                raise self._Done
+
+        parser = expat.ParserCreate()
+        parser.buffer_text = True
+        parser.StartElementHandler = start
+        parser.CharacterDataHandler = text
+        try:
+            parser.Parse(raw, True)
+        except self._Done:
+            return header, values
+        raise ValueError('Eumel payload misses the fields {}.'.format(', '.join(self.fields.difference(values))))
+
+
+# field paths per firmware version
+EUMEL_V1 = EumelParser(model_id='211', fields=('TotWhImp',))
+EUMEL_V2_1_1 = EumelParser(model_id='211', fields=('TotWhImp',))
 
 
 class DataLoggerV1(EnergyDevice):
@@ -16,30 +101,31 @@ class DataLoggerV1(EnergyDevice):
     Eumel DataLogger api v1.0 access implementation
     """
 
-    def __init__(self, ip, user, password):
+    def __init__(self, ip, user, password, skip_unchanged=False):
         """
         :param ip: Data loggers network IP
         :param user: User configured on the devices
         :param password: Password for this user
+        :param skip_unchanged: read_state sends conditional requests and returns None when the device answers not
+        modified or its measurement time did not change since the last read
         """
         self.eumel_api_url = ip + '/rest'
         self.auth = (user, password)
+        self.skip_unchanged = skip_unchanged
+        self._validators = {}
+        self._last_measurement_time = None
         super().__init__(manufacturer='Verbund', model='Eumel v1', serial_number=None, energy_unit=EnergyUnit.WATT_HOUR,
                          is_accumulated=True)
 
     def read_state(self, path=None) -> EnergyData:
-        if path:
-            tree = ElementTree.parse(path)
-            with open(path) as file:
-                raw = file.read()
-        else:
-            http_packet = requests.get(self.eumel_api_url, auth=self.auth)
-            raw = http_packet.content.decode()
-            tree = ElementTree.parse(raw)
-        tree_root = tree.getroot()
-        tree_header = tree_root[0].attrib
-        tree_leaves = {child.attrib['id']: child.text for child in tree_root[0][0]}
-        device = EnergyDevice(
+        raw = self._reach_source(path)
+        if raw is None:
+            return None
+        if self.skip_unchanged and EUMEL_V1.parse_header(raw).get('t') == self._last_measurement_time:
+            return None
+        tree_header, tree_leaves = EUMEL_V1.parse(raw)
+        self._last_measurement_time = tree_header['t']
+        device = device_metadata(
             manufacturer=tree_header['man'],
             model=tree_header['mod'],
             serial_number=tree_header['sn'],
@@ -50,42 +136,60 @@ class DataLoggerV1(EnergyDevice):
         energy = float(tree_leaves['TotWhImp'].replace('.', ''))
         mwh_energy = self.to_mwh(energy, self.energy_unit)
         measurement_epoch = int(time.mktime(time.strptime(tree_header['t'], time_format)))
-        return EnergyData(asset=device, access_epoch=access_epoch, raw=raw, measurement_epoch=measurement_epoch,
+        return EnergyData(device=device, access_epoch=access_epoch, raw=raw, measurement_epoch=measurement_epoch,
                           energy=mwh_energy)
 
     def write_state(self, *args, **kwargs):
         raise NotImplementedError
 
+    def _reach_source(self, path=None) -> str:
+        """
+        :param path: Read the payload from a file instead of the device
+        :return: Raw xml payload, None if not modified since the last read
+        """
+        if path:
+            with open(path) as file:
+                return file.read()
+        if self.skip_unchanged:
+            http_packet = session.conditional_get(self.eumel_api_url, self._validators, auth=self.auth,
+                                                  timeout=self.timeout)
+            if http_packet is None:
+                return None
+        else:
+            http_packet = session.get(self.eumel_api_url, auth=self.auth, timeout=self.timeout)
+        return http_packet.content.decode()
+
 
 class DataLoggerV2d1d1(EnergyDevice):
     """
     Eumel DataLogger api v2.1.1 access implementation
     """
 
-    def __init__(self, ip, user, password):
+    def __init__(self, ip, user, password, skip_unchanged=False):
         """
         :param ip: Data loggers network IP
         :param user: User configured on the devices
         :param password: Password for this user
+        :param skip_unchanged: read_state sends conditional requests and returns None when the device answers not
+        modified or its measurement time did not change since the last read
         """
         self.eumel_api_url = ip + '/wizard/public/api/rest'
         self.auth = (user, password)
+        self.skip_unchanged = skip_unchanged
+        self._validators = {}
+        self._last_measurement_time = None
         super().__init__(manufacturer='Verbund', model='Eumel v1', serial_number=None, energy_unit=EnergyUnit.WATT_HOUR,
                          is_accumulated=True)
 
     def read_state(self, path=None) -> EnergyData:
-        if path:
-            tree = ElementTree.parse(path)
-            with open(path) as file:
-                raw = file.read()
-        else:
-            http_packet = requests.get(self.eumel_api_url, auth=self.auth)
-            raw = http_packet.content.decode()
-            tree = ElementTree.ElementTree(ElementTree.fromstring(raw))
-        tree_root = tree.getroot()
-        tree_header = tree_root[0].attrib
-        tree_leaves = {child.attrib['id']: child.text for child in tree_root[0][1]}
-        device = EnergyDevice(
+        raw = self._reach_source(path)
+        if raw is None:
+            return None
+        if self.skip_unchanged and EUMEL_V2_1_1.parse_header(raw).get('t') == self._last_measurement_time:
+            return None
+        tree_header, tree_leaves = EUMEL_V2_1_1.parse(raw)
+        self._last_measurement_time = tree_header['t']
+        device = device_metadata(
             manufacturer=tree_header['man'],
             model=tree_header['mod'],
             serial_number=tree_header['sn'],
@@ -96,8 +200,25 @@ class DataLoggerV2d1d1(EnergyDevice):
         energy = float(tree_leaves['TotWhImp'])
         mwh_energy = self.to_mwh(energy, self.energy_unit)
         measurement_epoch = int(time.mktime(time.strptime(tree_header['t'], time_format)))
-        return EnergyData(asset=device, access_epoch=access_epoch, raw=raw, measurement_epoch=measurement_epoch,
+        return EnergyData(device=device, access_epoch=access_epoch, raw=raw, measurement_epoch=measurement_epoch,
                           energy=mwh_energy)
 
     def write_state(self, *args, **kwargs):
         raise NotImplementedError
+
+    def _reach_source(self, path=None) -> str:
+        """
+        :param path: Read the payload from a file instead of the device
+        :return: Raw xml payload, None if not modified since the last read
+        """
+        if path:
+            with open(path) as file:
+                return file.read()
+        if self.skip_unchanged:
+            http_packet = session.conditional_get(self.eumel_api_url, self._validators, auth=self.auth,
+                                                  timeout=self.timeout)
+            if http_packet is None:
+                return None
+        else:
+            http_packet = session.get(self.eumel_api_url, auth=self.auth, timeout=self.timeout)
+        return http_packet.content.decode()
@@ -1,23 +1,16 @@
-from enum import IntEnum
+import weakref
+from array import array
 
 from energyweb.interfaces import ExternalData, IntegrationPoint
-
-
-class EnergyUnit(IntEnum):
-    """
-    Possible units for effort and billing purposes. Determines the convertion algorithms.
-    """
-    JOULES = 0
-    WATT_HOUR = 1
-    KILOWATT_HOUR = 2
-    MEGAWATT_HOUR = 3
-    GIGAWATT_HOUR = 4
+from energyweb.eds import units
+from energyweb.eds.units import EnergyUnit
 
 
 class EnergyData(ExternalData):
     """
     Standard for collected energy and power data, to be transformed into mintable data.
     """
+    __slots__ = ('device', 'measurement_epoch', 'energy')
 
     def __init__(self, device, access_epoch, raw, energy, measurement_epoch):
         """
@@ -38,6 +31,8 @@ class EnergyDevice(IntegrationPoint):
     """
     Energy device or api abstraction. Can be smart-meters, battery controllers, inverters, gateways, clouds, so on.
     """
+    # seconds to wait for the device to answer, None for the session default
+    timeout = None
 
     def __init__(self, manufacturer, model, serial_number, energy_unit, is_accumulated, latitude=None, longitude=None):
         """
@@ -46,7 +41,7 @@ class EnergyDevice(IntegrationPoint):
         :param serial_number: EnergyAsset Serial Number
         :param latitude: EnergyAsset geolocation latitude
         :param longitude: EnergyAsset geolocation longitude
-        :param energy_unit: Energy unity
+        :param energy_unit: Energy unity, EnergyUnit or its name
         :param is_accumulated: Flags if the api provides accumulated power or hourly production
         """
         self.manufacturer = manufacturer
@@ -54,7 +49,7 @@ class EnergyDevice(IntegrationPoint):
         self.serial_number = serial_number
         self.latitude = latitude
         self.longitude = longitude
-        self.energy_unit = EnergyUnit[energy_unit.upper()]
+        self.energy_unit = energy_unit if isinstance(energy_unit, EnergyUnit) else EnergyUnit[energy_unit.upper()]
         self.is_accumulated = is_accumulated
 
     def read_state(self, *args, **kwargs) -> EnergyData:
@@ -80,14 +75,7 @@ class EnergyDevice(IntegrationPoint):
         :return: Value converted to MWh
         :rtype: float
         """
-        convert = lambda x: float(energy) / x
-        return {
-            EnergyUnit.WATT_HOUR: convert(10 ** 6),
-            EnergyUnit.KILOWATT_HOUR: convert(10 ** 3),
-            EnergyUnit.MEGAWATT_HOUR: convert(1),
-            EnergyUnit.GIGAWATT_HOUR: convert(1 * 10 ** -3),
-            EnergyUnit.JOULES: convert(1 * 2.77778 * 10 ** -10),
-        }.get(unit)
+        return units.to_mwh(energy, unit)
 
     @staticmethod
     def to_wh(energy: int, unit: EnergyUnit):
@@ -95,14 +83,80 @@ class EnergyDevice(IntegrationPoint):
         Converts energy measured value in predefined unit to Watt-Hour
         :param unit: EnergyUnit
         :param energy: Value measured at the source
-        :return: Value converted to MWh
+        :return: Value converted to Wh
         :rtype: int
         """
-        convert = lambda x: int(float(energy * x))
+        return units.to_wh(energy, unit)
+
+
+_devices = weakref.WeakValueDictionary()
+
+
+def device_metadata(manufacturer, model, serial_number, energy_unit, is_accumulated, latitude=None,
+                    longitude=None) -> EnergyDevice:
+    """
+    Shared EnergyDevice describing the metadata of a measurement device. Equal metadata returns the same instance while
+    it is referenced, so readings of one meter do not carry a copy each. Treat it as immutable.
+    :return: EnergyDevice
+    """
+    energy_unit = energy_unit if isinstance(energy_unit, EnergyUnit) else EnergyUnit[energy_unit.upper()]
+    key = (manufacturer, model, serial_number, energy_unit, is_accumulated, latitude, longitude)
+    device = _devices.get(key)
+    if device is None:
+        device = EnergyDevice(manufacturer, model, serial_number, energy_unit, is_accumulated, latitude, longitude)
+        _devices[key] = device
+    return device
+
+
+class EnergyDataBatch(ExternalData):
+    """
+    Columnar series of energy readings of one device.
+    Epochs and energy in watt-hours are stored in arrays of 64 bits integers instead of one EnergyData per reading.
+    """
+    __slots__ = ('device', 'measurement_epochs', 'energies')
+
+    def __init__(self, device, access_epoch, raw=None, measurement_epochs=(), energies=()):
+        """
+        :param device: Metadata about the measurement device. EnergyDevice
+        :param access_epoch: Time the external API was accessed
+        :param raw: Raw data collected for the whole batch, if kept
+        :param measurement_epochs: Time of each measurement at the source
+        :param energies: Measured energy of each measurement converted to watt-hours
+        """
+        if len(measurement_epochs) != len(energies):
+            raise AttributeError('Measurement epochs and energies must have the same length.')
+        self.device = device
+        self.measurement_epochs = array('q', measurement_epochs)
+        self.energies = array('q', energies)
+        ExternalData.__init__(self, access_epoch, raw)
+
+    def __len__(self):
+        return len(self.energies)
+
+    def __getitem__(self, index) -> EnergyData:
+        return EnergyData(device=self.device, access_epoch=self.access_epoch, raw=None, energy=self.energies[index],
+                          measurement_epoch=self.measurement_epochs[index])
+
+    def __iter__(self):
+        for measurement_epoch, energy in zip(self.measurement_epochs, self.energies):
+            yield EnergyData(device=self.device, access_epoch=self.access_epoch, raw=None, energy=energy,
+                             measurement_epoch=measurement_epoch)
+
+    def append(self, measurement_epoch: int, energy: int):
+        self.measurement_epochs.append(measurement_epoch)
+        self.energies.append(energy)
+
+    def total(self) -> int:
+        """
+        :return: Sum of the energy of all readings in watt-hours
+        """
+        return sum(self.energies)
+
+    def to_dict(self):
         return {
-            EnergyUnit.WATT_HOUR: convert(1),
-            EnergyUnit.KILOWATT_HOUR: convert(10 ** 3),
-            EnergyUnit.MEGAWATT_HOUR: convert(10 ** 6),
-            EnergyUnit.GIGAWATT_HOUR: convert(10 ** 9),
-            EnergyUnit.JOULES: convert(1 * 2.77778 * 10 ** -1),
-        }.get(unit)
+            'device': self.to_dict_or_self(self.device),
+            'access_epoch': self.access_epoch,
+            'raw': self.raw,
+            'measurement_epochs': self.measurement_epochs.tolist(),
+            'energies': self.energies.tolist()
+        }
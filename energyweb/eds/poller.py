@@ -0,0 +1,93 @@
+"""
+Concurrent polling of many energy devices
+"""
+import random
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from energyweb.eds.interfaces import EnergyDevice, EnergyData
+from energyweb.eds.session import DEFAULT_TIMEOUT
+
+
+class MeterPoller:
+    """
+    Reads the state of many EnergyDevice concurrently and streams the results as they arrive.
+    Blocking read_state calls run in a thread pool bounded by the concurrency limit, a timed out read holds its slot
+    until it returns. Each read starts after a random offset so meters behind the same gateway are not hit at once.
+    """
+
+    def __init__(self, devices: [EnergyDevice], concurrency: int = 16, jitter: float = 1.0,
+                 timeout: float = DEFAULT_TIMEOUT):
+        """
+        :param devices: Devices to poll
+        :param concurrency: Maximum number of reads in progress
+        :param jitter: Maximum start offset of each read in seconds
+        :param timeout: Seconds to wait for a read, unless the device has its own timeout attribute
+        """
+        self.devices = list(devices)
+        self.concurrency = concurrency
+        self.jitter = jitter
+        self.timeout = timeout
+        self.errors = {}
+        self._executor = ThreadPoolExecutor(max_workers=concurrency)
+        # shared by the polls, reads still running from a previous poll keep their slot
+        self._semaphore = None
+
+    async def poll(self):
+        """
+        Read every device once.
+        Failed or timed out reads are not yielded, they are in the errors dictionary until the next poll.
+        Devices returning None, ie. without a new measurement, are not yielded either.
+        :return: Async generator of tuples of device and EnergyData, in order of arrival
+        """
+        self.errors = {}
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        reads = [asyncio.ensure_future(self._read(device, self._semaphore)) for device in self.devices]
+        try:
+            for read in asyncio.as_completed(reads):
+                device, result = await read
+                if isinstance(result, Exception):
+                    self.errors[device] = result
+                elif result is not None:
+                    yield device, result
+        finally:
+            for read in reads:
+                read.cancel()
+
+    async def run(self, interval: float):
+        """
+        Poll forever, starting a new poll every interval seconds.
+        :param interval: Seconds between the start of two polls
+        :return: Async generator of tuples of device and EnergyData
+        """
+        loop = asyncio.get_event_loop()
+        while True:
+            started = loop.time()
+            async for result in self.poll():
+                yield result
+            await asyncio.sleep(max(interval - (loop.time() - started), 0))
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+    async def _read(self, device: EnergyDevice, semaphore: asyncio.Semaphore) -> (EnergyDevice, EnergyData):
+        await asyncio.sleep(random.uniform(0, self.jitter))
+        await semaphore.acquire()
+        loop = asyncio.get_event_loop()
+        timeout = getattr(device, 'timeout', None) or self.timeout
+        future = loop.run_in_executor(self._executor, device.read_state)
+
+        def release(done: asyncio.Future):
+            # the thread keeps running after a timeout, its slot is freed only when it ends so the executor queue
+            # never holds more reads than the concurrency limit
+            semaphore.release()
+            if not done.cancelled():
+                done.exception()
+
+        future.add_done_callback(release)
+        try:
+            energy_data = await asyncio.wait_for(asyncio.shield(future), timeout)
+        except Exception as e:
+            return device, e
+        return device, energy_data
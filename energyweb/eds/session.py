@@ -0,0 +1,103 @@
+"""
+Pooled keep-alive http sessions shared by the energy data sources, one per host
+"""
+import time
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_TIMEOUT = 10
+POOL_SIZE = 16
+# responses worth retrying: throttled or temporarily unavailable
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+_sessions = {}
+_lock = threading.Lock()
+
+
+def session_for(url: str) -> requests.Session:
+    """
+    Session reusing connections to the host of the url.
+    :param url: Must start with protocol. ie. https://my-url
+    :return: Shared requests session
+    """
+    parts = urlsplit(url)
+    host = '{}://{}'.format(parts.scheme, parts.netloc)
+    session = _sessions.get(host)
+    if session:
+        return session
+    with _lock:
+        if host not in _sessions:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+            session.mount(host, adapter)
+            _sessions[host] = session
+        return _sessions[host]
+
+
+def request(method: str, url: str, timeout: float = None, retries: int = 0, backoff: float = 0.5,
+            **kwargs) -> requests.Response:
+    """
+    Same as requests.request through the pooled session of the host.
+    Connection errors, timeouts and RETRY_STATUS responses are retried, waiting backoff seconds doubled on each attempt
+    or the Retry-After seconds of the response if longer. The last response or error is returned or raised.
+    :param timeout: Seconds to wait for the host. DEFAULT_TIMEOUT if None.
+    :param retries: Number of retries after the first attempt
+    :param backoff: Seconds to wait before the first retry
+    """
+    session = session_for(url)
+    for attempt in range(retries + 1):
+        wait = backoff * 2 ** attempt
+        try:
+            response = session.request(method, url, timeout=timeout or DEFAULT_TIMEOUT, **kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == retries:
+                raise
+        else:
+            if response.status_code not in RETRY_STATUS or attempt == retries:
+                return response
+            retry_after = response.headers.get('Retry-After', '')
+            if retry_after.isdigit():
+                wait = max(wait, int(retry_after))
+        time.sleep(wait)
+
+
+def get(url: str, timeout: float = None, **kwargs) -> requests.Response:
+    """
+    Same as requests.get through the pooled session of the host.
+    :param timeout: Seconds to wait for the host. DEFAULT_TIMEOUT if None.
+    """
+    return request('GET', url, timeout=timeout, **kwargs)
+
+
+def conditional_get(url: str, validators: dict, timeout: float = None, **kwargs) -> requests.Response:
+    """
+    Get sending the ETag and Last-Modified validators of the last response of the url, if the server gave any.
+    :param validators: Validators per url, updated in place. Keep one dictionary per device.
+    :param timeout: Seconds to wait for the host. DEFAULT_TIMEOUT if None.
+    :return: Response or None when the server answers 304 Not Modified
+    """
+    headers = dict(kwargs.pop('headers', None) or {})
+    etag, last_modified = validators.get(url, (None, None))
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+    response = get(url, timeout=timeout, headers=headers, **kwargs)
+    if response.status_code == 304:
+        return None
+    if response.ok:
+        validators[url] = (response.headers.get('ETag'), response.headers.get('Last-Modified'))
+    return response
+
+
+def close_all():
+    """
+    Close every pooled session, ie. on app clean up.
+    """
+    with _lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
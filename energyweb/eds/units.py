@@ -0,0 +1,104 @@
+"""
+Energy unit conversion with precomputed factors, for single values and measurement series
+"""
+import math
+from array import array
+from decimal import Decimal
+from enum import IntEnum
+
+
+class EnergyUnit(IntEnum):
+    """
+    Possible units for effort and billing purposes. Determines the convertion algorithms.
+    """
+    JOULES = 0
+    WATT_HOUR = 1
+    KILOWATT_HOUR = 2
+    MEGAWATT_HOUR = 3
+    GIGAWATT_HOUR = 4
+
+
+# watt-hours in one unit
+WH_FACTORS = {
+    EnergyUnit.JOULES: 1 / 3600,
+    EnergyUnit.WATT_HOUR: 1,
+    EnergyUnit.KILOWATT_HOUR: 10 ** 3,
+    EnergyUnit.MEGAWATT_HOUR: 10 ** 6,
+    EnergyUnit.GIGAWATT_HOUR: 10 ** 9,
+}
+
+# units in one megawatt-hour
+MWH_DIVISORS = {
+    EnergyUnit.JOULES: 3600 * 10 ** 6,
+    EnergyUnit.WATT_HOUR: 10 ** 6,
+    EnergyUnit.KILOWATT_HOUR: 10 ** 3,
+    EnergyUnit.MEGAWATT_HOUR: 1,
+    EnergyUnit.GIGAWATT_HOUR: 10 ** -3,
+}
+
+# relative float error below which a converted value is taken as the integer it represents, ie. 1.1 kWh is 1100 Wh
+_SNAP = 1e-12
+
+
+def to_wh(energy, unit: EnergyUnit) -> int:
+    """
+    Converts energy measured value in predefined unit to Watt-Hour
+    Integers in integer factor units convert exactly, Decimals in every unit. Floats are snapped to the integer they
+    represent when they only differ by float error, otherwise truncated like int().
+    :param energy: Value measured at the source
+    :param unit: EnergyUnit
+    :return: Value converted to Wh
+    """
+    factor = WH_FACTORS[unit]
+    if type(energy) is int and type(factor) is int:
+        return energy * factor
+    if isinstance(energy, Decimal):
+        # exact, there is no float error to snap
+        return int(energy * factor) if type(factor) is int else int(energy / round(1 / factor))
+    value = energy * factor
+    nearest = round(value)
+    if abs(value - nearest) <= _SNAP * abs(value):
+        return int(nearest)
+    return int(value)
+
+
+def to_mwh(energy, unit: EnergyUnit) -> float:
+    """
+    Converts energy measured value in predefined unit to Megawatt-Hour
+    :param energy: Value measured at the source
+    :param unit: EnergyUnit
+    :return: Value converted to MWh
+    """
+    return float(energy) / MWH_DIVISORS[unit]
+
+
+def to_wh_series(values, unit: EnergyUnit) -> array:
+    """
+    Converts a series of measured values to Watt-Hour with the same semantics of to_wh. Series of integers are
+    multiplied in one pass, other values, ie. floats and Decimals, are converted one by one by to_wh.
+    :param values: Iterable of values measured at the source
+    :param unit: EnergyUnit
+    :return: Array of signed 64 bits integers
+    """
+    values = values if isinstance(values, (list, tuple, array)) else list(values)
+    factor = WH_FACTORS[unit]
+    if type(factor) is int:
+        if isinstance(values, array) and values.typecode in 'bBhHiIlLqQ':
+            return array('q', [v * factor for v in values])
+        if all(type(v) is int for v in values):
+            return array('q', [v * factor for v in values])
+    return array('q', [to_wh(v, unit) for v in values])
+
+
+def sum_wh(values, unit: EnergyUnit) -> int:
+    """
+    Sum of a series of measured values in Watt-Hour. Values are summed in the source unit and converted once, so the
+    result does not accumulate conversion errors. Integers and Decimals are summed exactly.
+    :param values: Iterable of values measured at the source
+    :param unit: EnergyUnit
+    :return: Sum converted to Wh
+    """
+    values = values if isinstance(values, (list, tuple, array)) else list(values)
+    if not any(isinstance(v, float) for v in values):
+        return to_wh(sum(values), unit)
+    return to_wh(math.fsum(values), unit)
@@ -1,13 +1,16 @@
 import datetime
-import inspect
+
+from energyweb import serializer
 
 
 class Serializable(object):
     """
     Object serialization helper
     """
+    __slots__ = ()
+
     def __iter__(self):
-        for attr, value in self.__dict__.items():
+        for attr, value in self._attributes():
             if isinstance(value, datetime.datetime):
                 iso = value.isoformat()
                 yield attr, iso
@@ -25,17 +28,25 @@ class Serializable(object):
             else:
                 yield attr, value
 
+    def _attributes(self):
+        """
+        Attribute names and values of the instance, either in __dict__ or in __slots__
+        """
+        for cls in type(self).__mro__:
+            for attr in cls.__dict__.get('__slots__', ()):
+                if attr not in ('__dict__', '__weakref__') and hasattr(self, attr):
+                    yield attr, getattr(self, attr)
+        yield from getattr(self, '__dict__', {}).items()
+
     def to_dict(self):
-        result = {}
-        init = getattr(self, '__init__')
-        for parameter in inspect.signature(init).parameters:
-            att = getattr(self, parameter)
-            if isinstance(att, list) or isinstance(att, set):
-                att = [self.to_dict_or_self(o) for o in att]
-            if isinstance(att, (datetime.datetime, datetime.date)):
-                att = att.isoformat()
-            result[parameter] = self.to_dict_or_self(att)
-        return result
+        return serializer.to_dict(self)
+
+    def to_bytes(self, encoding: str = serializer.JSON) -> bytes:
+        """
+        :param encoding: serializer.JSON or serializer.MSGPACK
+        :return: Encoded dictionary of the object
+        """
+        return serializer.to_bytes(self, encoding)
 
     @staticmethod
     def to_dict_or_self(obj):
@@ -50,6 +61,7 @@ class ExternalData(Serializable):
     """
     Encapsulates collected data in a traceable fashion
     """
+    __slots__ = ('access_epoch', 'raw')
 
     def __init__(self, access_epoch, raw):
         """
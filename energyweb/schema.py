@@ -0,0 +1,160 @@
+"""
+Declarative schemas for configuration dictionaries, compiled once into validators reporting every error in one pass.
+
+A schema is made of:
+    - a type or tuple of types, ie. str or (int, float)
+    - a dict of key and schema, keys wrapped in Optional may be missing. Other keys are allowed.
+    - a list with a single schema, for lists of items of that schema
+    - a Check, for a schema with an extra condition
+"""
+import hashlib
+
+
+class Optional:
+    """
+    Key that may be missing in a dict schema
+    """
+    __slots__ = ('key',)
+
+    def __init__(self, key: str):
+        self.key = key
+
+
+class Check:
+    """
+    Schema with an extra condition on the value
+    """
+    __slots__ = ('schema', 'condition', 'message')
+
+    def __init__(self, schema, condition, message: str):
+        """
+        :param schema: Schema the value must match first
+        :param condition: Function of the value returning True when valid
+        :param message: Error message when the condition fails
+        """
+        self.schema = schema
+        self.condition = condition
+        self.message = message
+
+
+def compile_schema(schema):
+    """
+    Compiles a schema into a validator function.
+    :param schema: Schema as described in the module
+    :return: Function of the value, the path of the value and the list errors are appended to
+    """
+    if isinstance(schema, Check):
+        return _compile_check(schema)
+    if isinstance(schema, dict):
+        return _compile_dict(schema)
+    if isinstance(schema, list):
+        return _compile_list(schema)
+    if isinstance(schema, (type, tuple)):
+        return _compile_type(schema)
+    raise ValueError(f'Invalid schema {schema}.')
+
+
+def fingerprint(schema) -> str:
+    """
+    Stable description of a schema, including the code of its checks, ie. to invalidate caches of validated values
+    when the schema changes.
+    :param schema: Schema as described in the module
+    :return: Hex digest
+    """
+    return hashlib.sha256(_describe(schema).encode()).hexdigest()
+
+
+def _describe(schema) -> str:
+    if isinstance(schema, Check):
+        code = schema.condition.__code__
+        return 'check({},{},{},{})'.format(_describe(schema.schema), code.co_code.hex(), code.co_consts,
+                                             schema.message)
+    if isinstance(schema, dict):
+        return '{' + ','.join('{}{}:{}'.format('?' if isinstance(k, Optional) else '',
+                                                k.key if isinstance(k, Optional) else k, _describe(v))
+                              for k, v in schema.items()) + '}'
+    if isinstance(schema, list):
+        return '[' + _describe(schema[0]) + ']'
+    types = schema if isinstance(schema, tuple) else (schema,)
+    return '|'.join(t.__name__ for t in types)
+
+
+def validate(validator, value) -> [str]:
+    """
+    :param validator: Compiled schema
+    :param value: Value to validate
+    :return: List of errors, empty if the value is valid
+    """
+    errors = []
+    validator(value, '', errors)
+    return errors
+
+
+def _join(path: str, key) -> str:
+    if isinstance(key, int):
+        return f'{path}[{key}]'
+    return f'{path}.{key}' if path else key
+
+
+def _compile_type(types):
+    types = types if isinstance(types, tuple) else (types,)
+    names = ' or '.join(t.__name__ for t in types)
+    # booleans are ints, only accept them when asked for
+    rejects_bool = bool not in types
+
+    def validator(value, path, errors):
+        if not isinstance(value, types) or (rejects_bool and isinstance(value, bool)):
+            errors.append(f'{path or "configuration"}: expected {names}, got {type(value).__name__}.')
+            return False
+        return True
+    return validator
+
+
+def _compile_dict(schema: dict):
+    fields = tuple((key.key if isinstance(key, Optional) else key, isinstance(key, Optional), compile_schema(value))
+                   for key, value in schema.items())
+
+    def validator(value, path, errors):
+        if not isinstance(value, dict):
+            errors.append(f'{path or "configuration"}: expected a mapping, got {type(value).__name__}.')
+            return False
+        valid = True
+        for key, optional, field_validator in fields:
+            if key not in value:
+                if not optional:
+                    errors.append(f'{_join(path, key)}: missing.')
+                    valid = False
+            elif not field_validator(value[key], _join(path, key), errors):
+                valid = False
+        return valid
+    return validator
+
+
+def _compile_list(schema: list):
+    if len(schema) != 1:
+        raise ValueError('List schemas have a single item schema.')
+    item_validator = compile_schema(schema[0])
+
+    def validator(value, path, errors):
+        if not isinstance(value, list):
+            errors.append(f'{path or "configuration"}: expected a list, got {type(value).__name__}.')
+            return False
+        valid = True
+        for i, item in enumerate(value):
+            if not item_validator(item, _join(path, i), errors):
+                valid = False
+        return valid
+    return validator
+
+
+def _compile_check(check: Check):
+    inner = compile_schema(check.schema)
+
+    def validator(value, path, errors):
+        if not inner(value, path, errors):
+            return False
+        if not check.condition(value):
+            errors.append(f'{path or "configuration"}: {check.message}')
+            return False
+        return True
+    return validator
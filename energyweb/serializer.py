@@ -0,0 +1,115 @@
+"""
+Serialization of Serializable objects to plain dictionaries and encoded bytes.
+
+The fields of each class, ie. the parameters of its constructor, are introspected once and cached, the same for the
+conversion of each value type. orjson and msgpack are used to encode when installed.
+"""
+import json
+import inspect
+import datetime
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON = 'json'
+MSGPACK = 'msgpack'
+
+_fields = {}
+_converters = {}
+_VARIADIC = (inspect.Parameter.VAR_POSITIONAL, inspect.Parameter.VAR_KEYWORD)
+
+
+def fields(cls: type) -> tuple:
+    """
+    Names of the attributes serialized for the class, the parameters of its constructor.
+    :param cls: Class of the object
+    :return: Tuple of attribute names
+    """
+    names = _fields.get(cls)
+    if names is None:
+        parameters = list(inspect.signature(cls.__init__).parameters.values())[1:]
+        names = tuple(p.name for p in parameters if p.kind not in _VARIADIC)
+        _fields[cls] = names
+    return names
+
+
+def to_dict(obj) -> dict:
+    """
+    Dictionary of the fields of the object with values converted to plain types.
+    Objects with a to_dict method are converted by it, datetimes and dates to iso format, lists and sets to lists and
+    dictionaries item by item.
+    :param obj: Object to serialize
+    :return: Dictionary of plain values
+    """
+    return {name: to_plain(getattr(obj, name)) for name in fields(type(obj))}
+
+
+def to_plain(value):
+    """
+    Converts a single value with the same rules of to_dict.
+    """
+    cls = type(value)
+    try:
+        converter = _converters[cls]
+    except KeyError:
+        converter = _converters[cls] = _converter(cls)
+    return converter(value) if converter else value
+
+
+def to_bytes(obj, encoding: str = JSON) -> bytes:
+    """
+    Encodes the serialized object.
+    JSON is compact, orjson encodes it if installed. Values orjson doesn't support, ie. integers above 64 bits, are
+    encoded by the json module.
+    :param obj: Serializable object or already plain value
+    :param encoding: JSON or MSGPACK
+    :return: Encoded bytes
+    """
+    plain = obj.to_dict() if hasattr(obj, 'to_dict') else to_plain(obj)
+    if encoding == JSON:
+        if orjson:
+            try:
+                return orjson.dumps(plain, option=orjson.OPT_NON_STR_KEYS)
+            except TypeError:
+                pass
+        return json.dumps(plain, separators=(',', ':')).encode()
+    if encoding == MSGPACK:
+        if not msgpack:
+            raise EnvironmentError('Install msgpack to encode to msgpack.')
+        return msgpack.packb(plain, use_bin_type=True)
+    raise ValueError(f'Unknown encoding {encoding}.')
+
+
+def _converter(cls: type):
+    if callable(getattr(cls, 'to_dict', None)):
+        return _call_to_dict
+    if issubclass(cls, (datetime.datetime, datetime.date)):
+        return _isoformat
+    if issubclass(cls, (list, set)):
+        return _sequence
+    if issubclass(cls, dict):
+        return _mapping
+    return None
+
+
+def _call_to_dict(value):
+    return value.to_dict()
+
+
+def _isoformat(value):
+    return value.isoformat()
+
+
+def _sequence(value):
+    return [to_plain(item) for item in value]
+
+
+def _mapping(value):
+    return {to_plain(k): to_plain(v) for k, v in value.items()}
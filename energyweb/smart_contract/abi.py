@@ -0,0 +1,142 @@
+"""
+Precompiled encoders and decoders for contract functions described in an abi
+"""
+from collections import namedtuple
+
+from eth_abi.decoding import ContextFramesBytesIO, TupleDecoder
+from eth_abi.encoding import TupleEncoder
+from eth_abi.registry import registry
+from eth_utils import event_abi_to_log_topic, function_abi_to_4byte_selector, to_checksum_address
+from web3.utils.events import get_event_data
+
+from energyweb.smart_contract.bundle import signature
+
+
+def _checksum_list(addresses):
+    return [to_checksum_address(address) for address in addresses]
+
+
+# web3 returns addresses in checksum format, keep it that way
+_OUTPUT_CONVERTERS = {
+    'address': to_checksum_address,
+    'address[]': _checksum_list,
+}
+
+
+class ContractFunction:
+    """
+    Encoder of the call data and decoder of the returned data of one abi function.
+    Functions with more than one output return a named tuple with the output names without leading underscores.
+    """
+    __slots__ = ('name', 'signature', 'selector', 'record', '_encoder', '_decoder', '_converters', '_single')
+
+    def __init__(self, function_abi: dict, selector: bytes = None):
+        """
+        :param function_abi: Abi item of type function
+        :param selector: Precomputed 4 bytes selector, hashed from the abi if None
+        """
+        self.name = function_abi['name']
+        self.signature = signature(function_abi)
+        self.selector = selector or function_abi_to_4byte_selector(function_abi)
+        input_types = [i['type'] for i in function_abi['inputs']]
+        output_types = [o['type'] for o in function_abi.get('outputs', [])]
+        self._encoder = TupleEncoder(encoders=[registry.get_encoder(t) for t in input_types])
+        self._decoder = TupleDecoder(decoders=[registry.get_decoder(t) for t in output_types])
+        self._converters = tuple((i, _OUTPUT_CONVERTERS[t]) for i, t in enumerate(output_types)
+                                 if t in _OUTPUT_CONVERTERS)
+        self._single = len(output_types) == 1
+        fields = [o['name'].lstrip('_') or 'output_{}'.format(i) for i, o in enumerate(function_abi.get('outputs', []))]
+        self.record = namedtuple(self.name, fields, rename=True) if len(fields) > 1 else None
+
+    def encode_input(self, *args) -> bytes:
+        """
+        :param args: Arguments in the same order as in the abi
+        :return: Call data with the function selector
+        """
+        return self.selector + self._encoder(args)
+
+    def decode_output(self, data: bytes):
+        """
+        :param data: Data returned by eth_call
+        :return: Single value, named tuple for many outputs or None when the function has no outputs
+        """
+        values = self._decoder(ContextFramesBytesIO(bytes(data)))
+        if self._converters:
+            values = list(values)
+            for i, convert in self._converters:
+                values[i] = convert(values[i])
+        if self._single:
+            return values[0]
+        if self.record is None:
+            return None
+        return self.record._make(values)
+
+
+class ContractEvent:
+    """
+    Log topic and decoder of one abi event.
+    """
+    __slots__ = ('name', 'signature', 'topic', 'abi')
+
+    def __init__(self, event_abi: dict, topic: bytes = None):
+        """
+        :param event_abi: Abi item of type event
+        :param topic: Precomputed log topic, hashed from the abi if None
+        """
+        self.name = event_abi['name']
+        self.signature = signature(event_abi)
+        self.topic = topic or event_abi_to_log_topic(event_abi)
+        self.abi = event_abi
+
+    def decode_log(self, log: dict) -> dict:
+        """
+        :param log: Log entry as returned by eth_getLogs
+        :return: Event data with the decoded arguments in the 'args' key
+        """
+        return get_event_data(self.abi, log)
+
+
+_compiled = {}
+_precomputed = {}
+
+
+def precompute(abi: list, selectors: {str: bytes}, topics: {str: bytes}):
+    """
+    Registers the hashes of an abi computed ahead, ie. by the bundle build, so compiling it skips hashing.
+    :param abi: Contract abi, the same list later given to contract_functions and contract_events
+    :param selectors: Function selectors per signature
+    :param topics: Event topics per signature
+    """
+    _precomputed[id(abi)] = (abi, selectors, topics)
+
+
+def _compile(abi: list) -> tuple:
+    compiled = _compiled.get(id(abi))
+    if compiled is None or compiled[0] is not abi:
+        owner, selectors, topics = _precomputed.get(id(abi), (abi, {}, {}))
+        if owner is not abi:
+            selectors, topics = {}, {}
+        functions = {item['name']: ContractFunction(item, selectors.get(signature(item)))
+                     for item in abi if item['type'] == 'function'}
+        events = {item['name']: ContractEvent(item, topics.get(signature(item)))
+                  for item in abi if item['type'] == 'event'}
+        compiled = _compiled[id(abi)] = (abi, functions, events)
+    return compiled
+
+
+def contract_functions(abi: list) -> {str: ContractFunction}:
+    """
+    Compiles the functions of an abi once and reuses them in every following call.
+    :param abi: Contract abi as in the contract modules
+    :return: Dictionary of function name and its ContractFunction. Overloaded names keep the last declaration.
+    """
+    return _compile(abi)[1]
+
+
+def contract_events(abi: list) -> {str: ContractEvent}:
+    """
+    Compiles the events of an abi once and reuses them in every following call.
+    :param abi: Contract abi as in the contract modules
+    :return: Dictionary of event name and its ContractEvent
+    """
+    return _compile(abi)[2]
@@ -0,0 +1,97 @@
+"""
+Contract bundles: the contract modules built into compact json files with precomputed function selectors and event
+topics, loaded on demand.
+
+They are built into the package by setup.py build_py, which only needs eth-utils as declared in pyproject.toml, or
+in place with:
+    python -m energyweb.smart_contract.bundle
+Contracts without a built bundle are loaded from their python module.
+"""
+import os
+import json
+import importlib
+import threading
+
+BUNDLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bundles')
+
+# bundle name and the module declaring the contract dictionary
+CONTRACTS = {
+    'origin.asset_reg_v1': 'energyweb.smart_contract.origin.asset_reg_v1',
+    'origin.certificate_v1': 'energyweb.smart_contract.origin.certificate_v1',
+    'origin.consumer_v1': 'energyweb.smart_contract.origin.consumer_v1',
+    'origin.producer_v1': 'energyweb.smart_contract.origin.producer_v1',
+    'usn.rent_v1': 'energyweb.smart_contract.usn.rent_v1',
+}
+
+_loaded = {}
+_lock = threading.Lock()
+
+
+def signature(item: dict) -> str:
+    """
+    :param item: Abi item of type function or event
+    :return: Canonical signature, ie. transfer(address,uint256)
+    """
+    return '{}({})'.format(item['name'], ','.join(i['type'] for i in item.get('inputs', [])))
+
+
+def load(name: str) -> dict:
+    """
+    Contract dictionary with address, abi and bytecode keys. Loaded once, every call returns the same dictionary.
+    The precomputed selectors and topics of a built bundle are handed to the abi module.
+    :param name: Bundle name as in CONTRACTS
+    :return: Contract dictionary
+    """
+    contract = _loaded.get(name)
+    if contract is not None:
+        return contract
+    if name not in CONTRACTS:
+        raise ValueError(f'Unknown contract {name}.')
+    with _lock:
+        if name not in _loaded:
+            path = os.path.join(BUNDLE_PATH, name + '.json')
+            if os.path.exists(path):
+                with open(path) as file:
+                    bundle = json.load(file)
+                from energyweb.smart_contract import abi
+                contract = {key: bundle[key] for key in ('address', 'abi', 'bytecode')}
+                abi.precompute(contract['abi'], {k: bytes.fromhex(v) for k, v in bundle['selectors'].items()},
+                               {k: bytes.fromhex(v) for k, v in bundle['topics'].items()})
+            else:
+                contract = importlib.import_module(CONTRACTS[name]).contract
+            _loaded[name] = contract
+        return _loaded[name]
+
+
+def build(path: str = BUNDLE_PATH) -> [str]:
+    """
+    Writes the bundle of every contract in CONTRACTS. Hashing only needs eth-utils, not web3, so it runs at build time.
+    :param path: Directory of the bundles
+    :return: Paths of the written files
+    """
+    from eth_utils import keccak
+    os.makedirs(path, exist_ok=True)
+    written = []
+    for name, module in CONTRACTS.items():
+        contract = importlib.import_module(module).contract
+        hashes = {'function': {}, 'event': {}}
+        for item in contract['abi']:
+            if item['type'] in hashes:
+                hashes[item['type']][signature(item)] = keccak(text=signature(item))
+        bundle = {
+            'address': contract['address'],
+            'abi': contract['abi'],
+            'bytecode': contract['bytecode'],
+            'selectors': {s: h[:4].hex() for s, h in hashes['function'].items()},
+            'topics': {s: h.hex() for s, h in hashes['event'].items()},
+        }
+        file_name = os.path.join(path, name + '.json')
+        with open(file_name, 'w') as file:
+            json.dump(bundle, file, separators=(',', ':'), sort_keys=True)
+        written.append(file_name)
+    return written
+
+
+if __name__ == '__main__':
+    for file_name in build():
+        print(file_name)
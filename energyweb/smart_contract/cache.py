@@ -0,0 +1,132 @@
+"""
+Read-through cache for smart-contract calls, invalidated when new blocks are mined
+"""
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from web3 import Web3
+
+
+class CacheEntry:
+    """
+    Cached call result and the block it was read on
+    """
+    __slots__ = ('value', 'block_number', 'read_at')
+
+    def __init__(self, value, block_number: int, read_at: float):
+        self.value = value
+        self.block_number = block_number
+        self.read_at = read_at
+
+
+class BlockCache:
+    """
+    Caches results of read-only contract calls until a new block is mined.
+    Entries read on an older block are stale and refreshed synchronously. With max_stale set, stale entries are served
+    while a refresh runs in background, for at most max_stale seconds: opt in only for reads that can lag behind the
+    latest change, not ie. the last hash read before minting.
+    """
+
+    def __init__(self, w3: Web3, block_poll_interval: float = 1.0, max_stale: float = 0, workers: int = 2):
+        """
+        :param w3: Web3 instance connected to the blockchain client
+        :param block_poll_interval: Seconds between checks for a new block number. Calls in between trust the last one.
+        :param max_stale: Seconds a stale entry can be served while it is being refreshed. Zero disables it.
+        :param workers: Number of threads refreshing stale entries
+        """
+        self.w3 = w3
+        self.block_poll_interval = block_poll_interval
+        self.max_stale = max_stale
+        self._entries = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._generation = 0
+        self._block_number = None
+        self._block_checked_at = 0.0
+
+    def block_number(self) -> int:
+        """
+        Latest known block number, polled from the client at most every block_poll_interval seconds.
+        """
+        now = time.time()
+        if self._block_number is None or now - self._block_checked_at >= self.block_poll_interval:
+            self._block_number = self.w3.eth.blockNumber
+            self._block_checked_at = now
+        return self._block_number
+
+    def get(self, key: tuple, loader):
+        """
+        Read-through access to the cache.
+        :param key: Tuple of contract address, asset id and method name
+        :param loader: Callable without arguments returning the fresh value from the contract
+        :return: Cached, stale or freshly loaded value
+        """
+        block_number = self.block_number()
+        entry = self._entries.get(key)
+        if entry and entry.block_number == block_number:
+            return entry.value
+        if entry and time.time() - entry.read_at < self.max_stale:
+            self._refresh_async(key, loader)
+            return entry.value
+        with self._lock:
+            generation = self._generation
+        return self._load(key, loader, block_number, generation)
+
+    def invalidate(self, contract_address: str = None, asset_id: int = None, block_number: int = None):
+        """
+        Drop entries, for instance after our own transaction changed the contract state.
+        :param contract_address: Only entries of this contract. All contracts if None.
+        :param asset_id: Only entries of this asset. All assets if None.
+        :param block_number: Block that included the transaction, it becomes the latest known block.
+        """
+        with self._lock:
+            self._generation += 1
+            for key in list(self._entries):
+                if contract_address not in (None, key[0]) or asset_id not in (None, key[1]):
+                    continue
+                del self._entries[key]
+            if block_number is not None and (self._block_number is None or block_number > self._block_number):
+                self._block_number = block_number
+                self._block_checked_at = time.time()
+
+    def _load(self, key: tuple, loader, block_number: int, generation: int):
+        value = loader()
+        with self._lock:
+            # results of reads started before an invalidation are outdated
+            if generation == self._generation:
+                self._entries[key] = CacheEntry(value, block_number, time.time())
+        return value
+
+    def _refresh_async(self, key: tuple, loader):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+            generation = self._generation
+
+        def refresh():
+            try:
+                self._load(key, loader, self.block_number(), generation)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        self._executor.submit(refresh)
+
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def shared_cache(w3: Web3) -> BlockCache:
+    """
+    BlockCache with default settings shared by the clients of the same Web3 connection.
+    :param w3: Web3 instance connected to the blockchain client
+    :return: BlockCache
+    """
+    with _shared_lock:
+        if w3 not in _shared:
+            _shared[w3] = BlockCache(w3)
+        return _shared[w3]
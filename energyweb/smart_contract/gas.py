@@ -0,0 +1,145 @@
+"""
+Gas limit and gas price estimation for raw transactions sent by EVM smart-contract clients
+"""
+import time
+import threading
+
+from web3 import Web3
+
+
+class GasEstimator:
+    """
+    Keeps a gas profile per contract method signature. Profiles are built from estimateGas calls and the gas
+    actually used by mined transactions and are refreshed from the client after a while.
+    """
+
+    def __init__(self, w3: Web3, refresh_interval: int = 600, margin: float = 1.2, fallback_gas: int = 400000):
+        """
+        :param w3: Web3 instance connected to the blockchain client
+        :param refresh_interval: Seconds a cached profile is trusted before estimating again
+        :param margin: Multiplier applied to the highest known gas usage of a method
+        :param fallback_gas: Gas limit used when the client fails to estimate and there is no profile yet
+        """
+        self.w3 = w3
+        self.refresh_interval = refresh_interval
+        self.margin = margin
+        self.fallback_gas = fallback_gas
+        self._profiles = {}
+
+    def estimate(self, contract_name: str, method_name: str, function, transaction: dict) -> int:
+        """
+        Gas limit to use for a transaction calling the contract method.
+        :param contract_name: Contract key as in the contracts list of the client.
+        :param method_name: Method name as in the contract abi.
+        :param function: Bound web3 contract function, with arguments already applied.
+        :param transaction: Transaction fields without gas, at least 'from'.
+        :return: Gas limit
+        """
+        key = (contract_name, method_name)
+        profile = self._profiles.get(key)
+        if profile and time.time() - profile[1] < self.refresh_interval:
+            return self._with_margin(profile[0])
+        try:
+            estimated = function.estimateGas(transaction)
+        except ValueError:
+            # estimation reverts when the contract rejects the call, keep the transaction sendable for diagnostics
+            return self._with_margin(profile[0]) if profile else self.fallback_gas
+        self._profiles[key] = (estimated, time.time())
+        return self._with_margin(estimated)
+
+    def observe(self, contract_name: str, method_name: str, gas_used: int):
+        """
+        Feed the gas consumed by a mined transaction back into the method profile.
+        :param contract_name: Contract key as in the contracts list of the client.
+        :param method_name: Method name as in the contract abi.
+        :param gas_used: Value of gasUsed in the transaction receipt
+        """
+        key = (contract_name, method_name)
+        profile = self._profiles.get(key)
+        if profile and profile[0] >= gas_used:
+            return
+        self._profiles[key] = (gas_used, profile[1] if profile else time.time())
+
+    def invalidate(self, contract_name: str = None, method_name: str = None):
+        """
+        Drop cached profiles. Without parameters all profiles are dropped.
+        """
+        if contract_name is None:
+            self._profiles.clear()
+            return
+        for key in [k for k in self._profiles if k[0] == contract_name and method_name in (None, k[1])]:
+            del self._profiles[key]
+
+    def _with_margin(self, gas: int) -> int:
+        return int(gas * self.margin)
+
+
+class GasPriceOracle:
+    """
+    Suggests a gas price by sampling the prices paid by transactions in the latest blocks.
+    """
+
+    def __init__(self, w3: Web3, sample_blocks: int = 20, percentile: int = 50, min_price: int = 0,
+                 max_price: int = None):
+        """
+        :param w3: Web3 instance connected to the blockchain client
+        :param sample_blocks: Number of blocks prior to the latest to sample
+        :param percentile: Percentile of the sampled transaction gas prices to suggest, 0 to 100
+        :param min_price: Lower bound of the suggested price in wei
+        :param max_price: Upper bound of the suggested price in wei
+        """
+        if not 0 <= percentile <= 100:
+            raise AssertionError('Percentile must be between 0 and 100.')
+        self.w3 = w3
+        self.sample_blocks = sample_blocks
+        self.percentile = percentile
+        self.min_price = min_price
+        self.max_price = max_price
+        self._block_prices = {}
+        self._price = None
+        self._price_block = None
+
+    def gas_price(self) -> int:
+        """
+        Gas price in wei. Only recalculated when a new block arrives.
+        :return: Suggested gas price
+        """
+        latest = self.w3.eth.blockNumber
+        if self._price is not None and self._price_block == latest:
+            return self._price
+        first = max(latest - self.sample_blocks + 1, 0)
+        for number in [n for n in self._block_prices if n < first]:
+            del self._block_prices[number]
+        prices = []
+        for number in range(first, latest + 1):
+            if number not in self._block_prices:
+                block = self.w3.eth.getBlock(number, full_transactions=True)
+                self._block_prices[number] = [tx['gasPrice'] for tx in block.transactions]
+            prices.extend(self._block_prices[number])
+        if prices:
+            prices.sort()
+            price = prices[(len(prices) - 1) * self.percentile // 100]
+        else:
+            price = self.w3.eth.gasPrice
+        price = max(price, self.min_price)
+        if self.max_price is not None:
+            price = min(price, self.max_price)
+        self._price, self._price_block = price, latest
+        return price
+
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def shared_gas(w3: Web3) -> (GasEstimator, GasPriceOracle):
+    """
+    GasEstimator and GasPriceOracle with default settings shared by the clients of the same Web3 connection, so gas
+    profiles and sampled prices are learned once per client url.
+    :param w3: Web3 instance connected to the blockchain client
+    :return: Tuple of GasEstimator and GasPriceOracle
+    """
+    with _shared_lock:
+        if w3 not in _shared:
+            _shared[w3] = (GasEstimator(w3), GasPriceOracle(w3))
+        return _shared[w3]
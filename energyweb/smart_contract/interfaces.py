@@ -1,15 +1,40 @@
 import time
+import threading
+from array import array
+from itertools import accumulate
 
 from web3 import Web3, HTTPProvider
 from web3.contract import ConciseContract
 from web3.utils.filters import Filter
 
+from energyweb.eds import session
 from energyweb.eds.interfaces import EnergyData
 from energyweb.carbonemission import CarbonEmissionData
-from energyweb.interfaces import BlockchainClient
+from energyweb.interfaces import BlockchainClient, ExternalData
+from energyweb.smart_contract.abi import contract_events, contract_functions
+from energyweb.smart_contract.gas import GasEstimator, GasPriceOracle, shared_gas
 
 
-class GreenEnergy(EnergyData, CarbonEmissionData):
+_providers = {}
+_providers_lock = threading.Lock()
+
+
+def web3_for(client_url: str) -> Web3:
+    """
+    Web3 connected to the client, shared by every smart contract client of the url in the process.
+    :param client_url: URL like address to the blockchain client api.
+    :return: Web3
+    """
+    w3 = _providers.get(client_url)
+    if w3 is None:
+        with _providers_lock:
+            w3 = _providers.get(client_url)
+            if w3 is None:
+                w3 = _providers[client_url] = Web3(HTTPProvider(client_url))
+    return w3
+
+
+class GreenEnergy(ExternalData):
     """
     Green energy data read from external data sources of energy and carbon emissions
     """
@@ -35,6 +60,24 @@ class GreenEnergy(EnergyData, CarbonEmissionData):
         co2_saved = int(calculated_co2 * pow(10, 3))
         return co2_saved
 
+    @staticmethod
+    def co2_saved_series(energies, intensities) -> (array, array):
+        """
+        Amounts of carbon dioxide saved over a series of readings, ie. a day of a device, in one pass.
+        Each value rounds like co2_saved does for one reading: per interval from the co2 of the interval, cumulative
+        from the unrounded co2 summed so far, so rounding errors don't add up over the series.
+        :param energies: Energy produced in each interval in Wh, ie. EnergyDataBatch.energies of a not accumulated device
+        :param intensities: Carbon intensity in kg/Wh of each interval, aligned with energies
+        :return: Tuple of arrays of integer co2 saved per interval and cumulative
+        """
+        if len(energies) != len(intensities):
+            raise ValueError('Energies and intensities must be aligned.')
+        factor = pow(10, 3)
+        co2 = [e * c for e, c in zip(energies, intensities)]
+        per_interval = array('q', [int(value * factor) for value in co2])
+        cumulative = array('q', [int(total * factor) for total in accumulate(co2)])
+        return per_interval, cumulative
+
 
 class EVMSmartContractClient(BlockchainClient):
     """
@@ -43,20 +86,72 @@ class EVMSmartContractClient(BlockchainClient):
         - https://github.com/paritytech/parity
         - https://github.com/energywebfoundation/energyweb-client
     """
+    # seconds to wait for the client and retries of batch calls, through the pooled session. Session default if None.
+    timeout = None
+    retries = 2
 
-    def __init__(self, credentials: tuple, contracts: dict, client_url: str, max_retries: int, retry_pause: int):
+    def __init__(self, credentials: tuple, contracts: dict, client_url: str, max_retries: int, retry_pause: int,
+                 gas_estimator: GasEstimator = None, gas_price_oracle: GasPriceOracle = None):
         """
         :param credentials: Network credentials ( address, password )
         :param contracts: Contracts structure containing abi and bytecode keys.
         :param client_url: URL like address to the blockchain client api.
         :param max_retries: Software will try to connect to provider this amount of times
         :param retry_pause: Software will wait between reconnection trials this amount of seconds
+        :param gas_estimator: Gas limit estimation for raw transactions. Defaults to the one shared by the clients of
+        the same client url.
+        :param gas_price_oracle: Gas price suggestion for raw transactions. Defaults to the one shared by the clients of
+        the same client url.
+        The Web3 connection and the defaults are created on first use.
         """
         self.MAX_RETRIES = max_retries
         self.SECONDS_BETWEEN_RETRIES = retry_pause
-        self.w3 = Web3(HTTPProvider(client_url))
+        self.client_url = client_url
         self.credentials = credentials
         self.contracts = contracts
+        self._w3 = None
+        self._gas_estimator = gas_estimator
+        self._gas_price_oracle = gas_price_oracle
+        self._contract_instances = {}
+
+    @property
+    def w3(self) -> Web3:
+        if self._w3 is None:
+            self._w3 = web3_for(self.client_url)
+        return self._w3
+
+    @property
+    def gas_estimator(self) -> GasEstimator:
+        if self._gas_estimator is None:
+            self._gas_estimator = shared_gas(self.w3)[0]
+        return self._gas_estimator
+
+    @property
+    def gas_price_oracle(self) -> GasPriceOracle:
+        if self._gas_price_oracle is None:
+            self._gas_price_oracle = shared_gas(self.w3)[1]
+        return self._gas_price_oracle
+
+    def _contract_instance(self, contract_name: str, concise: bool = False):
+        """
+        Web3 contract of the contracts list, created once per address and abi.
+        :param contract_name: Contract key as in the contracts list used to instantiate this class.
+        :param concise: ConciseContract instead of a regular Contract
+        :return: Contract instance
+        """
+        contract = self.contracts[contract_name]
+        key = (contract['address'], id(contract['abi']), concise)
+        cached = self._contract_instances.get(key)
+        # the abi is kept with the instance so its id is not reused
+        if cached is None or cached[0] is not contract['abi']:
+            options = {'ContractFactoryClass': ConciseContract} if concise else {}
+            instance = self.w3.eth.contract(
+                abi=contract['abi'],
+                address=self.w3.toChecksumAddress(contract['address']),
+                bytecode=contract['bytecode'],
+                **options)
+            cached = self._contract_instances[key] = (contract['abi'], instance)
+        return cached[1]
 
     def is_synced(self) -> bool:
         """
@@ -82,12 +177,7 @@ class EVMSmartContractClient(BlockchainClient):
             raise ConnectionError('Client is not synced to the last block.')
         self.w3.personal.unlockAccount(account=self.w3.toChecksumAddress(self.credentials[0]),
                                        passphrase=self.credentials[1])
-        contract = self.contracts[contract_name]
-        contract_instance = self.w3.eth.contract(
-            abi=contract['abi'],
-            address=self.w3.toChecksumAddress(contract['address']),
-            bytecode=contract['bytecode'],
-            ContractFactoryClass=ConciseContract)
+        contract_instance = self._contract_instance(contract_name, concise=True)
         tx_hash = getattr(contract_instance, method_name)(*args, transact={
             'from': self.w3.toChecksumAddress(self.credentials[0])})
         if not tx_hash:
@@ -106,45 +196,78 @@ class EVMSmartContractClient(BlockchainClient):
         :param contract_name: Contract key as in the contracts list used to instantiate this class.
         :param method_name: Method name as in the contract abi.
         :param args: Arguments passed when calling the method. Must be in the same order as in the abi.
-        :return: The transaction receipt after mining is confirmed.
+        :return: Returned value, or a named tuple with the output names when the method returns many values.
         """
         if not self.is_synced():
             raise ConnectionError('Client is not synced to the last block.')
+        return self._call(contract_name, method_name, *args)
+
+    def _call(self, contract_name: str, method_name: str, *args):
+        """
+        Same as call, without checking if the client is synced. Used by bulk reads checking it only once.
+        """
         contract = self.contracts[contract_name]
-        contract_instance = self.w3.eth.contract(
-            abi=contract['abi'],
-            address=self.w3.toChecksumAddress(contract['address']),
-            bytecode=contract['bytecode'],
-            ContractFactoryClass=ConciseContract)
-        return getattr(contract_instance, method_name)(*args)
+        function = contract_functions(contract['abi'])[method_name]
+        data = self.w3.eth.call({
+            'to': self.w3.toChecksumAddress(contract['address']),
+            'data': function.encode_input(*args)})
+        return function.decode_output(data)
+
+    def call_batch(self, contract_name: str, method_name: str, args_list: [tuple], block_identifier='latest') -> list:
+        """
+        Calls a read-only smart-contract method many times in one json-rpc batch request.
+        :param contract_name: Contract key as in the contracts list used to instantiate this class.
+        :param method_name: Method name as in the contract abi.
+        :param args_list: One tuple of arguments per call, in the same order as in the abi.
+        :param block_identifier: Block number or 'latest'. All calls read the same block.
+        :return: Results in the same order of args_list
+        """
+        if not args_list:
+            return []
+        contract = self.contracts[contract_name]
+        function = contract_functions(contract['abi'])[method_name]
+        to = self.w3.toChecksumAddress(contract['address'])
+        block = block_identifier if isinstance(block_identifier, str) else hex(block_identifier)
+        payload = [{
+            'jsonrpc': '2.0',
+            'id': i,
+            'method': 'eth_call',
+            'params': [{'to': to, 'data': self.w3.toHex(function.encode_input(*args))}, block]
+        } for i, args in enumerate(args_list)]
+        # eth_call is read-only, safe to retry
+        http_packet = session.request('POST', self.client_url, timeout=self.timeout, retries=self.retries, json=payload)
+        if not http_packet.ok:
+            raise ConnectionError('Batch call failed with status {}.'.format(http_packet.status_code))
+        results = sorted(http_packet.json(), key=lambda response: response['id'])
+        errors = [response['error'] for response in results if 'error' in response]
+        if errors:
+            raise ConnectionError('Batch call failed: {}'.format(errors[0]))
+        return [function.decode_output(self.w3.toBytes(hexstr=response['result'])) for response in results]
 
     def send_raw(self, contract_name: str, method_name: str, *args) -> dict:
         """
         Sends a raw transaction to call a smart-contract method.
         First it creates the transaction, then fetches the account tx count - to avoid repetition attacks,
-        determines gas price, signs it, and finally sends it to the blockchain client.
+        estimates gas limit and gas price, signs it, and finally sends it to the blockchain client.
         :param contract_name: Contract key as in the contracts list used to instantiate this class.
         :param method_name: Method name as in the contract abi.
         :param args: Arguments passed when calling the method. Must be in the same order as in the abi.
         :return: The transaction receipt after mining is confirmed.
         """
-        contract = self.contracts[contract_name]
-        contract_instance = self.w3.eth.contract(
-            abi=contract['abi'],
-            address=self.w3.toChecksumAddress(contract['address']),
-            bytecode=contract['bytecode'])
+        contract_instance = self._contract_instance(contract_name)
 
         if not self.is_synced():
             raise ConnectionError('Client is not synced to the last block.')
 
         nonce = self.w3.eth.getTransactionCount(account=self.w3.toChecksumAddress(self.credentials[0]))
+        function = getattr(contract_instance.functions, method_name)(*args)
         transaction = {
             'from': self.w3.toChecksumAddress(self.credentials[0]),
-            'gas': 400000,
-            'gasPrice': self.w3.toWei('0', 'gwei'),
             'nonce': nonce,
         }
-        tx = getattr(contract_instance.functions, method_name)(*args).buildTransaction(transaction)
+        transaction['gas'] = self.gas_estimator.estimate(contract_name, method_name, function, transaction)
+        transaction['gasPrice'] = self.gas_price_oracle.gas_price()
+        tx = function.buildTransaction(transaction)
         private_key = bytearray.fromhex(self.credentials[1])
         signed_txn = self.w3.eth.account.signTransaction(tx, private_key=private_key)
         tx_hash = self.w3.eth.sendRawTransaction(signed_txn.rawTransaction)
@@ -155,6 +278,7 @@ class EVMSmartContractClient(BlockchainClient):
         for _ in range(self.MAX_RETRIES):
             tx_receipt = self.w3.eth.getTransactionReceipt(tx_hash)
             if tx_receipt and tx_receipt['blockNumber']:
+                self.gas_estimator.observe(contract_name, method_name, tx_receipt['gasUsed'])
                 break
             time.sleep(self.SECONDS_BETWEEN_RETRIES)
         return tx_receipt
@@ -167,14 +291,30 @@ class EVMSmartContractClient(BlockchainClient):
         :param block_count: Number of blocks prior to the latest to start filtering from
         :return: Filter
         """
-        contract = self.contracts[contract_name]
-        contract_instance = self.w3.eth.contract(
-            abi=contract['abi'],
-            address=self.w3.toChecksumAddress(contract['address']),
-            bytecode=contract['bytecode'])
+        contract_instance = self._contract_instance(contract_name)
         latest_block = self.w3.eth.getBlock('latest')
         return getattr(contract_instance.events, event_name)().createFilter(fromBlock=latest_block.number - block_count)
 
+    def get_events(self, contract_name: str, event_names: [str], from_block: int, to_block='latest') -> [dict]:
+        """
+        Fetch and decode logs of many events of one contract in a single eth_getLogs request.
+        Unlike filters it does not need the filter api enabled on the client.
+        :param contract_name: Contract key as in the contracts list used to instantiate this class.
+        :param event_names: Like written in the abi
+        :param from_block: First block to search, inclusive
+        :param to_block: Last block to search, inclusive
+        :return: Decoded events in chain order, the name of the event is in the 'event' key
+        """
+        contract = self.contracts[contract_name]
+        events = contract_events(contract['abi'])
+        by_topic = {events[name].topic: events[name] for name in event_names}
+        logs = self.w3.eth.getLogs({
+            'address': self.w3.toChecksumAddress(contract['address']),
+            'fromBlock': from_block,
+            'toBlock': to_block,
+            'topics': [[self.w3.toHex(topic) for topic in by_topic]]})
+        return [by_topic[bytes(log['topics'][0])].decode_log(log) for log in logs]
+
     def create_event_trigger(self, contract_name: str, event_name: str, block_count: int = 1000) -> dict:
         """
         Todo: Fix this to get the blocks and check for new events, demands memory or persistence
@@ -1,11 +1,13 @@
 """
 Library containing the Certificate of Origin v1.0 integration classes
 """
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
 from energyweb.eds.interfaces import EnergyData
 from energyweb.smart_contract.interfaces import EVMSmartContractClient
-from energyweb.smart_contract.origin.consumer_v1 import contract as consumer_v1
-from energyweb.smart_contract.origin.producer_v1 import contract as producer_v1
-from energyweb.smart_contract.origin.asset_reg_v1 import contract as asset_reg_v1
+from energyweb.smart_contract.cache import BlockCache, shared_cache
+from energyweb.smart_contract import bundle
 
 
 class ProducedEnergy(EnergyData):
@@ -51,18 +53,19 @@ class OriginV1(EVMSmartContractClient):
     def mint(self, energy: EnergyData) -> dict:
         raise NotImplementedError
 
-    def __init__(self, asset_id: int, wallet_add: str, wallet_pwd: str, client_url: str):
+    def __init__(self, asset_id: int, wallet_add: str, wallet_pwd: str, client_url: str, cache: BlockCache = None):
         """
         :param asset_id: ID received in device registration.
         :param wallet_add: Network wallet address
         :param wallet_add: Network wallet password
         :param client_url: URL like address to the blockchain client api.
+        :param cache: Cache for last_hash and last_state. Defaults to the one shared by the clients of the client_url.
         contract_address is not used from task_config
         """
         contracts = {
-            "producer": producer_v1,
-            "consumer": consumer_v1,
-            "asset_reg": asset_reg_v1
+            "producer": bundle.load('origin.producer_v1'),
+            "consumer": bundle.load('origin.consumer_v1'),
+            "asset_reg": bundle.load('origin.asset_reg_v1')
         }
         credentials = (wallet_add, wallet_pwd)
         max_retries = 1000
@@ -70,6 +73,29 @@ class OriginV1(EVMSmartContractClient):
 
         self.asset_id = asset_id
         super().__init__(credentials, contracts, client_url, max_retries, retry_pause)
+        self._cache = cache
+
+    @property
+    def cache(self) -> BlockCache:
+        if self._cache is None:
+            self._cache = shared_cache(self.w3)
+        return self._cache
+
+    def cached_call(self, contract_name: str, method_name: str):
+        """
+        Read-only call of an asset method served from the block cache.
+        :param contract_name: Contract key as in the contracts list used to instantiate this class.
+        :param method_name: Method name as in the contract abi. Takes the asset id as only argument.
+        :return: Call result
+        """
+        key = (self.contracts[contract_name]['address'], self.asset_id, method_name)
+        return self.cache.get(key, lambda: self.call(contract_name, method_name, self.asset_id))
+
+    def _invalidate_cache(self, contract_name: str, receipt: dict):
+        """
+        Our own meter read changed the asset state, drop its cached reads.
+        """
+        self.cache.invalidate(self.contracts[contract_name]['address'], self.asset_id, receipt['blockNumber'])
 
     def register_asset(self, country: str, region: str, zip_code: str, city: str, street: str, house_number: str,
                        latitude: str, longitude: str):
@@ -126,6 +152,7 @@ class OriginProducer(OriginV1):
                                 energy.co2_saved, energy.is_co2_down)
         if not receipt:
             raise ConnectionError
+        self._invalidate_cache('producer', receipt)
         return receipt
 
     def last_hash(self):
@@ -136,7 +163,7 @@ class OriginProducer(OriginV1):
         Call stack:
             function getAssetDataLog(uint _assetId)
         """
-        receipt = self.call('producer', 'getLastSmartMeterReadFileHash', self.asset_id)
+        receipt = self.cached_call('producer', 'getLastSmartMeterReadFileHash')
         if not receipt:
             raise ConnectionError
         return receipt
@@ -158,9 +185,9 @@ class OriginProducer(OriginV1):
                     bool _active,
                     bytes32 _lastSmartMeterReadFileHash
                     )
+        :return: Named tuple with the output names without leading underscores, ie. receipt.lastSmartMeterReadWh
         """
-        # TODO store with names keys
-        receipt = self.call('producer', 'getAssetGeneral', self.asset_id)
+        receipt = self.cached_call('producer', 'getAssetGeneral')
         if not receipt:
             raise ConnectionError
         return receipt
@@ -195,6 +222,7 @@ class OriginConsumer(OriginV1):
                                 energy.previous_hash.encode(), energy.is_meter_down)
         if not receipt:
             raise ConnectionError
+        self._invalidate_cache('consumer', receipt)
         return receipt
 
     def last_hash(self):
@@ -205,7 +233,7 @@ class OriginConsumer(OriginV1):
         Call stack:
             function getAssetDataLog(uint _assetId)
         """
-        receipt = self.call('consumer', 'getLastSmartMeterReadFileHash', self.asset_id)
+        receipt = self.cached_call('consumer', 'getLastSmartMeterReadFileHash')
         if not receipt:
             raise ConnectionError
         return receipt
@@ -230,8 +258,151 @@ class OriginConsumer(OriginV1):
                     bool _active,
                     bytes32 _lastSmartMeterReadFileHash
                     )
+        :return: Named tuple with the output names without leading underscores, ie. receipt.lastSmartMeterReadWh
         """
-        receipt = self.call('consumer', 'getAssetGeneral', self.asset_id)
+        receipt = self.cached_call('consumer', 'getAssetGeneral')
         if not receipt:
             raise ConnectionError
         return receipt
+
+
+class CertificateIndex:
+    """
+    Local copy of the certificates ledger indexed by owner, asset and retired state.
+    Certificates are the named tuples returned by getCertificate.
+    """
+
+    def __init__(self):
+        self.certificates = {}
+        self._by_owner = defaultdict(set)
+        self._by_asset = defaultdict(set)
+        self._retired = set()
+
+    def __len__(self):
+        return len(self.certificates)
+
+    def put(self, certificate_id: int, certificate):
+        """
+        Add or replace a certificate and update the indexes.
+        """
+        old = self.certificates.get(certificate_id)
+        if old:
+            self._by_owner[old.owner].discard(certificate_id)
+            self._by_asset[old.assetId].discard(certificate_id)
+        self.certificates[certificate_id] = certificate
+        self._by_owner[certificate.owner].add(certificate_id)
+        self._by_asset[certificate.assetId].add(certificate_id)
+        if certificate.retired:
+            self._retired.add(certificate_id)
+        else:
+            self._retired.discard(certificate_id)
+
+    def owned_by(self, owner: str, retired: bool = None) -> dict:
+        """
+        :param owner: Account address in checksum format
+        :param retired: Filter by retired state, None for all
+        :return: Dictionary of certificate id and certificate
+        """
+        return self._select(self._by_owner.get(owner, ()), retired)
+
+    def of_asset(self, asset_id: int, retired: bool = None) -> dict:
+        """
+        :param asset_id: ID received in device registration.
+        :param retired: Filter by retired state, None for all
+        :return: Dictionary of certificate id and certificate
+        """
+        return self._select(self._by_asset.get(asset_id, ()), retired)
+
+    def retired(self) -> dict:
+        """
+        :return: Dictionary of certificate id and certificate of every retired certificate
+        """
+        return self._select(self._retired, None)
+
+    def _select(self, ids, retired: bool) -> dict:
+        if retired is not None:
+            ids = [i for i in ids if (i in self._retired) == retired]
+        return {i: self.certificates[i] for i in ids}
+
+
+class CertificateClient(EVMSmartContractClient):
+    """
+    Certificates of origin ledger reader.
+
+    Keeps a local CertificateIndex filled by a parallel backfill of all certificates and updated by following the
+    contract events.
+    """
+
+    def __init__(self, contract_address: str, wallet_add: str, wallet_pwd: str, client_url: str, workers: int = 8,
+                 log_chunk_blocks: int = 5000):
+        """
+        :param contract_address: Certificate logic contract address
+        :param wallet_add: Network wallet address
+        :param wallet_pwd: Network wallet password
+        :param client_url: URL like address to the blockchain client api.
+        :param workers: Number of parallel requests to the client during backfill
+        :param log_chunk_blocks: Maximum number of blocks of one getLogs request when following events
+        """
+        contracts = {"certificate": dict(bundle.load('origin.certificate_v1'), address=contract_address)}
+        credentials = (wallet_add, wallet_pwd)
+        max_retries = 1000
+        retry_pause = 5
+
+        self.workers = workers
+        self.log_chunk_blocks = log_chunk_blocks
+        self.index = CertificateIndex()
+        self.last_block = None
+        super().__init__(credentials, contracts, client_url, max_retries, retry_pause)
+
+    def mint(self, energy: EnergyData) -> dict:
+        raise NotImplementedError
+
+    def get_certificate(self, certificate_id: int):
+        """
+        Source:
+            CertificateLogic.sol
+        Call stack:
+            function getCertificate(uint _certificateId) external view returns (uint _assetId, address _owner,
+                uint _powerInW, bool _retired, bytes32 _dataLog, uint _coSaved, address _escrow, uint _creationTime)
+        """
+        return self.call('certificate', 'getCertificate', certificate_id)
+
+    def backfill(self) -> int:
+        """
+        Read every certificate in the ledger with parallel requests and replace the local index.
+        Events emitted from the current block on are applied by follow.
+        :return: Number of certificates
+        """
+        if not self.is_synced():
+            raise ConnectionError('Client is not synced to the last block.')
+        start_block = self.w3.eth.blockNumber
+        length = self._call('certificate', 'getCertificateListLength')
+        index = CertificateIndex()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            certificates = executor.map(lambda i: self._call('certificate', 'getCertificate', i), range(length))
+            for certificate_id, certificate in enumerate(certificates):
+                index.put(certificate_id, certificate)
+        self.index = index
+        self.last_block = start_block - 1
+        return length
+
+    def follow(self) -> int:
+        """
+        Apply certificate events mined since the last backfill or follow to the local index.
+        Logs are requested log_chunk_blocks blocks at a time, the progress is kept after each chunk.
+        :return: Number of events applied
+        """
+        if self.last_block is None:
+            raise AttributeError('Backfill the index before following events.')
+        latest_block = self.w3.eth.blockNumber
+        applied = 0
+        while self.last_block < latest_block:
+            to_block = min(self.last_block + self.log_chunk_blocks, latest_block)
+            events = self.get_events('certificate', ['LogCreatedCertificate', 'LogCertificateOwnerChanged',
+                                                     'LogRetireRequest'], self.last_block + 1, to_block)
+            changed = {event['args']['_certificateId'] for event in events}
+            for certificate_id in changed:
+                self.index.put(certificate_id, self._call('certificate', 'getCertificate', certificate_id))
+            self.last_block = to_block
+            applied += len(events)
+        return applied
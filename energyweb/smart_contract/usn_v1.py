@@ -0,0 +1,206 @@
+"""
+Library containing the Universal Sharing Network v1.0 integration classes
+"""
+import time
+import asyncio
+
+from energyweb.eds.interfaces import EnergyData
+from energyweb.smart_contract.interfaces import EVMSmartContractClient
+from energyweb.smart_contract import bundle
+
+
+class RentingV1(EVMSmartContractClient):
+    """
+    Universal Sharing Network renting contract.
+
+    Tracks the renting state of many devices: at most one getLogs and one batched getRentingState request per block,
+    only for the devices touched by LogRented or LogReturned events or whose rent expired. Every full_refresh_blocks
+    all devices are read again.
+    """
+
+    def __init__(self, wallet_add: str, wallet_pwd: str, client_url: str, contract_address: str = None,
+                 poll_interval: float = 1.0, full_refresh_blocks: int = 100, max_watch_failures: int = 3):
+        """
+        :param wallet_add: Network wallet address
+        :param wallet_pwd: Network wallet password
+        :param client_url: URL like address to the blockchain client api.
+        :param contract_address: Renting contract address. Defaults to the one of the usn.rent_v1 bundle.
+        :param poll_interval: Seconds between checks for a new block while watching
+        :param full_refresh_blocks: Number of blocks between reading the state of all tracked devices
+        :param max_watch_failures: Failed updates in a row after which watching stops and the waiters get the error
+        """
+        rent_v1 = bundle.load('usn.rent_v1')
+        contract = dict(rent_v1, address=contract_address) if contract_address else rent_v1
+        credentials = (wallet_add, wallet_pwd)
+        max_retries = 1000
+        retry_pause = 5
+
+        self.poll_interval = poll_interval
+        self.full_refresh_blocks = full_refresh_blocks
+        self.max_watch_failures = max_watch_failures
+        self.states = {}
+        self.last_block = None
+        self._last_full_refresh = None
+        self._waiters = {}
+        self._watcher = None
+        super().__init__(credentials, {"rent": contract}, client_url, max_retries, retry_pause)
+
+    def mint(self, energy: EnergyData) -> dict:
+        raise NotImplementedError
+
+    def track(self, *device_ids: bytes):
+        """
+        Add devices to the tracked list. Their state is read on the next update.
+        :param device_ids: bytes32 ids of the devices
+        """
+        for device_id in device_ids:
+            self.states.setdefault(device_id, None)
+
+    def untrack(self, *device_ids: bytes):
+        for device_id in device_ids:
+            self.states.pop(device_id, None)
+
+    def renting_state(self, device_id: bytes):
+        """
+        Source:
+            Rent.sol
+        Call stack:
+            function getRentingState(bytes32 id, address user) public view returns (bool rentable, bool free,
+                bool open, address controller, uint64 rentedUntil, uint64 rentedFrom, uint128 props)
+        """
+        return self.call('rent', 'getRentingState', device_id, self.w3.toChecksumAddress(self.credentials[0]))
+
+    def price(self, device_id: bytes, seconds_to_rent: int, token: str) -> int:
+        user = self.w3.toChecksumAddress(self.credentials[0])
+        return self.call('rent', 'price', device_id, user, seconds_to_rent, self.w3.toChecksumAddress(token))
+
+    def rent(self, device_id: bytes, seconds_to_rent: int, token: str) -> dict:
+        receipt = self.send_raw('rent', 'rent', device_id, seconds_to_rent, self.w3.toChecksumAddress(token))
+        if not receipt:
+            raise ConnectionError
+        return receipt
+
+    def return_object(self, device_id: bytes) -> dict:
+        receipt = self.send_raw('rent', 'returnObject', device_id)
+        if not receipt:
+            raise ConnectionError
+        return receipt
+
+    def update(self) -> set:
+        """
+        Refresh the tracked states if a new block was mined.
+        :return: Ids of the devices whose state was read
+        """
+        return self._apply(*self._fetch(dict(self.states)))
+
+    def _fetch(self, tracked: dict) -> (int, dict):
+        """
+        Reads the states that changed since the last block, without modifying the tracked states.
+        :param tracked: Copy of the tracked states
+        :return: Latest block number and the states read by device id
+        """
+        latest_block = self.w3.eth.blockNumber
+        if latest_block == self.last_block:
+            return latest_block, {}
+        if self.last_block is None or latest_block - self._last_full_refresh >= self.full_refresh_blocks:
+            stale = set(tracked)
+        else:
+            events = self.get_events('rent', ['LogRented', 'LogReturned'], self.last_block + 1, latest_block)
+            now = time.time()
+            stale = {event['args']['id'] for event in events if event['args']['id'] in tracked}
+            stale.update(i for i, state in tracked.items()
+                         if state is None or (not state.free and 0 < state.rentedUntil <= now))
+        ids = list(stale)
+        user = self.w3.toChecksumAddress(self.credentials[0])
+        results = self.call_batch('rent', 'getRentingState', [(i, user) for i in ids], latest_block)
+        return latest_block, dict(zip(ids, results))
+
+    def _apply(self, latest_block: int, read: dict) -> set:
+        if latest_block == self.last_block:
+            return set()
+        if self.last_block is None or latest_block - self._last_full_refresh >= self.full_refresh_blocks:
+            self._last_full_refresh = latest_block
+        # devices untracked while reading are left out
+        stale = {device_id for device_id in read if device_id in self.states}
+        for device_id in stale:
+            self.states[device_id] = read[device_id]
+        self.last_block = latest_block
+        self._notify(stale)
+        return stale
+
+    async def watch(self):
+        """
+        Keep the tracked states updated, one update per poll_interval. Blocking requests run in the loop executor on a
+        copy of the tracked states, the results are applied in the loop. Failed updates are retried every poll_interval
+        up to max_watch_failures times in a row, then the error is raised to the waiters too.
+        """
+        loop = asyncio.get_event_loop()
+        failures = 0
+        while True:
+            try:
+                result = await loop.run_in_executor(None, self._fetch, dict(self.states))
+            except Exception as error:
+                failures += 1
+                if failures >= self.max_watch_failures:
+                    self._fail(error)
+                    raise
+                await asyncio.sleep(self.poll_interval)
+                continue
+            failures = 0
+            self._apply(*result)
+            await asyncio.sleep(self.poll_interval)
+
+    async def wait_until_rented(self, device_id: bytes, timeout: float = None):
+        """
+        Waits until the device is rented.
+        :param device_id: bytes32 id of the device. It is tracked if it wasn't.
+        :param timeout: Seconds to wait before raising asyncio.TimeoutError, forever if None.
+        :return: Renting state
+        """
+        return await self._wait(device_id, lambda state: not state.free, timeout)
+
+    async def wait_until_returned(self, device_id: bytes, timeout: float = None):
+        """
+        Waits until the device is free again.
+        :param device_id: bytes32 id of the device. It is tracked if it wasn't.
+        :param timeout: Seconds to wait before raising asyncio.TimeoutError, forever if None.
+        :return: Renting state
+        """
+        return await self._wait(device_id, lambda state: state.free, timeout)
+
+    async def _wait(self, device_id: bytes, condition, timeout: float):
+        self.track(device_id)
+        state = self.states[device_id]
+        if state is not None and condition(state):
+            return state
+        if not self._watcher or self._watcher.done():
+            self._watcher = asyncio.ensure_future(self.watch())
+            # the error is raised to the waiters
+            self._watcher.add_done_callback(lambda task: task.cancelled() or task.exception())
+        future = asyncio.get_event_loop().create_future()
+        waiter = (condition, future)
+        self._waiters.setdefault(device_id, []).append(waiter)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            waiters = self._waiters.get(device_id, [])
+            if waiter in waiters:
+                waiters.remove(waiter)
+
+    def _notify(self, device_ids: set):
+        for device_id in device_ids:
+            state = self.states.get(device_id)
+            for condition, future in list(self._waiters.get(device_id, [])):
+                if state is not None and not future.done() and condition(state):
+                    future.get_loop().call_soon_threadsafe(self._resolve, future, state)
+
+    def _fail(self, error: Exception):
+        for waiters in self._waiters.values():
+            for _, future in waiters:
+                if not future.done():
+                    future.set_exception(error)
+
+    @staticmethod
+    def _resolve(future: asyncio.Future, state):
+        if not future.done():
+            future.set_result(state)
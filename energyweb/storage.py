@@ -10,6 +10,16 @@ import base58
 
 from energyweb.interfaces import Serializable
 
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
 
 class ChainFile:
     """
@@ -32,17 +42,92 @@ class ChainLink:
         return self.last_link
 
 
+class JsonCodec:
+    """
+    Encodes records as json text, the default file format.
+    """
+    extension = 'json'
+
+    def encode(self, record: dict) -> bytes:
+        return json.dumps(record).encode()
+
+    def decode(self, data: bytes) -> dict:
+        return json.loads(data)
+
+
+class MsgpackCodec:
+    """
+    Encodes records as msgpack, optionally compressed by zstandard.
+
+    The byte layout is deterministic: dictionary keys are sorted at every level and compression runs single threaded
+    at a fixed level, so the same record always yields the same file hash. A dictionary trained on device payloads with
+    train_dictionary improves compression of small records. The same dictionary is needed to decode.
+    """
+
+    def __init__(self, compress: bool = False, level: int = 3, dictionary: bytes = None):
+        """
+        :param compress: Compress the encoded record with zstandard
+        :param level: zstandard compression level
+        :param dictionary: zstandard dictionary, see train_dictionary
+        """
+        if not msgpack:
+            raise EnvironmentError('Install msgpack to use the msgpack codec.')
+        if (compress or dictionary) and not zstandard:
+            raise EnvironmentError('Install zstandard to compress records.')
+        self.compress = compress or dictionary is not None
+        self.extension = 'msgpack.zst' if self.compress else 'msgpack'
+        self.level = level
+        self.dictionary = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+
+    def encode(self, record: dict) -> bytes:
+        data = msgpack.packb(_sorted(record), use_bin_type=True)
+        if self.compress:
+            # new compressor per call: they are not thread safe
+            data = zstandard.ZstdCompressor(level=self.level, dict_data=self.dictionary, threads=0).compress(data)
+        return data
+
+    def decode(self, data: bytes) -> dict:
+        if self.compress:
+            data = zstandard.ZstdDecompressor(dict_data=self.dictionary).decompress(data)
+        return msgpack.unpackb(data, raw=False)
+
+
+def train_dictionary(codec: MsgpackCodec, records: [dict], size: int = 16384) -> bytes:
+    """
+    Trains a zstandard dictionary on sample records, ie. recent readings of the devices in use.
+    :param codec: Uncompressed codec used to encode the samples
+    :param records: Sample records, the more the better. A few hundred at least.
+    :param size: Maximum dictionary size in bytes
+    :return: Dictionary bytes to store and give to MsgpackCodec
+    """
+    if not zstandard:
+        raise EnvironmentError('Install zstandard to train a dictionary.')
+    if codec.compress:
+        raise ValueError('Train on the uncompressed encoding.')
+    return zstandard.train_dictionary(size, [codec.encode(record) for record in records]).as_bytes()
+
+
+def _sorted(value):
+    if isinstance(value, dict):
+        return {k: _sorted(value[k]) for k in sorted(value)}
+    if isinstance(value, (list, tuple)):
+        return [_sorted(item) for item in value]
+    return value
+
+
 class OnDiskChain:
     """
     Saves a pickle with the data in chain format.
     """
-    def __init__(self, chain_file_name: str, path_to_files: str):
+    def __init__(self, chain_file_name: str, path_to_files: str, codec=None):
         """
         :param chain_file_name:
         :param path_to_files:
+        :param codec: Encoding of the data files. JsonCodec if None.
         """
         self.chain_file = os.path.join(path_to_files, chain_file_name)
         self.path = path_to_files
+        self.codec = codec or JsonCodec()
         os.makedirs(path_to_files, exist_ok=True)
         if not os.path.exists(self.chain_file):
             self.__memory = None
@@ -99,8 +184,17 @@ class OnDiskChain:
     def _save_file(self, data):
         if not os.path.exists(self.path):
             os.makedirs(self.path)
-        file_name_mask = os.path.join(self.path, '%Y-%m-%d-%H:%M:%S.json')
+        file_name_mask = os.path.join(self.path, '%Y-%m-%d-%H:%M:%S.' + self.codec.extension)
         file_name = datetime.datetime.now().strftime(file_name_mask)
-        with open(file_name, 'w+') as file:
-            json.dump(data.to_dict(), file)
+        with open(file_name, 'wb') as file:
+            file.write(self.codec.encode(data.to_dict()))
         return file_name
+
+    def read_file(self, file_name: str) -> dict:
+        """
+        Decode a data file of the chain, ie. for audits.
+        :param file_name: File name as returned by add_to_chain
+        :return: Stored dictionary
+        """
+        with open(file_name, 'rb') as file:
+            return self.codec.decode(file.read())
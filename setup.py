@@ -2,12 +2,34 @@
 https://pypi.org/
 https://pypi.org/classifiers/
 """
+import sys
 import pathlib
 import setuptools
+from setuptools.command.build_py import build_py
 
 # The directory containing this file
 HERE = pathlib.Path(__file__).parent
 
+
+class BuildPyWithBundles(build_py):
+    """
+    Builds the contract bundles into the package, see energyweb/smart_contract/bundle.py
+    """
+
+    def run(self):
+        super().run()
+        sys.path.insert(0, str(HERE))
+        try:
+            from energyweb.smart_contract import bundle
+            file_names = bundle.build(str(pathlib.Path(self.build_lib, 'energyweb', 'smart_contract', 'bundles')))
+        except ImportError as error:
+            raise RuntimeError(f'Building the contract bundles needs the build requirements of pyproject.toml: {error}')
+        finally:
+            sys.path.pop(0)
+        for file_name in file_names:
+            self.announce(f'built {file_name}', level=2)
+
+
 # The text of the README file
 README = (HERE / "README.md").read_text()
 
@@ -21,6 +43,8 @@ setuptools.setup(
     long_description_content_type="text/markdown",
     url="https://github.com/energywebfoundation/ew-link-bond",
     packages=setuptools.find_packages(exclude=["docs", "tests"]),
+    package_data={"energyweb.smart_contract": ["bundles/*.json"]},
+    cmdclass={"build_py": BuildPyWithBundles},
     install_requires=['web3>=4.8.0,<5.0.0', 'colorlog>=3.1.4', 'base58>=1.0.3'],
     keywords=['ethereum', 'blockchain', 'energy-web', 'energy', 'smart-energy_meter'],
     classifiers=[
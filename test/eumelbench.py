@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+"""
+Compares the streaming Eumel parser with full ElementTree parsing over the recorded payloads in docs.
+"""
+import os
+import timeit
+
+from xml.etree import ElementTree
+
+from energyweb.eds.eumel import EUMEL_V1, EUMEL_V2_1_1
+
+DOCS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'docs')
+PAYLOADS = [('EumelXMLv1.xml', EUMEL_V1, 0), ('EumelXMLv2.1.1.xml', EUMEL_V2_1_1, 1)]
+
+
+def full_tree(raw: str, model_index: int):
+    tree_root = ElementTree.fromstring(raw)
+    tree_header = tree_root[0].attrib
+    tree_leaves = {child.attrib['id']: child.text for child in tree_root[0][model_index]}
+    return tree_header, tree_leaves['TotWhImp']
+
+
+if __name__ == '__main__':
+    number = 10000
+    for file_name, parser, model_index in PAYLOADS:
+        with open(os.path.join(DOCS, file_name)) as file:
+            raw = file.read()
+        header, values = parser.parse(raw)
+        if (header, values['TotWhImp']) != full_tree(raw, model_index):
+            raise AssertionError(f'Parsers disagree on {file_name}')
+        old = timeit.timeit(lambda: full_tree(raw, model_index), number=number)
+        new = timeit.timeit(lambda: parser.parse(raw), number=number)
+        print(f'{file_name}: ElementTree {old / number * 10 ** 6:.1f}us, '
+              f'streaming {new / number * 10 ** 6:.1f}us, {old / new:.2f}x')
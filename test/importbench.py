@@ -0,0 +1,25 @@
+#!/usr/bin/env python
+"""
+Measures the import time of energyweb in fresh interpreters, for a worker needing only the dispatcher and for one
+loading every public name as the package used to do on import.
+"""
+import os
+import sys
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+SCENARIOS = [
+    ('dispatcher only', 'import energyweb.dispatcher'),
+    ('every public name', 'import energyweb\nfor name in energyweb.__all__: getattr(energyweb, name)'),
+]
+
+
+def import_time(code: str, runs: int) -> float:
+    timer = 'import time\nt = time.perf_counter()\n{}\nprint(time.perf_counter() - t)'.format(code)
+    times = [float(subprocess.check_output([sys.executable, '-c', timer], cwd=ROOT)) for _ in range(runs)]
+    return min(times)
+
+
+if __name__ == '__main__':
+    for name, code in SCENARIOS:
+        print(f'{name}: {import_time(code, 5) * 1000:.1f}ms')
@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+"""
+Compares find_by on indexed attributes with scanning every stored model, as the former MemoryDAO did.
+"""
+import timeit
+from copy import deepcopy
+
+from energyweb.database.dao import Model
+from energyweb.database.memorydao import MemoryDAO
+
+
+class Reading(Model):
+
+    def __init__(self, reg_id=None, device: str = None, day: int = None, energy: int = None, tags: list = None):
+        super().__init__(reg_id)
+        self.device = device
+        self.day = day
+        self.energy = energy
+        self.tags = tags
+
+
+def scanned(stack: dict, attributes: dict) -> list:
+    return [deepcopy(obj) for obj in stack.values() if all(getattr(obj, k) == v for k, v in attributes.items())]
+
+
+if __name__ == '__main__':
+    number = 100
+    size = 100000
+    query = {'device': 'device-42', 'day': 42}
+    readings = [Reading(i, f'device-{i % 1000}', i % 100, i * 10, ['raw']) for i in range(size)]
+    daos = {
+        'scan': MemoryDAO(),
+        'indexed': MemoryDAO(indexes=('device', 'day')),
+        'indexed, not copied': MemoryDAO(indexes=('device', 'day'), copy_on_read=False),
+    }
+    for dao in daos.values():
+        for reading in readings:
+            dao.create(reading)
+    expected = scanned(daos['scan']._stack, query)
+    old = timeit.timeit(lambda: scanned(daos['scan']._stack, query), number=number) / number
+    print(f'{size} models, {len(expected)} matches of {query}: former scan {old * 1000:.2f}ms')
+    for name, dao in daos.items():
+        if [r.reg_id for r in dao.find_by(query)] != [r.reg_id for r in expected]:
+            raise AssertionError(f'{name} find_by disagrees with the scan')
+        new = timeit.timeit(lambda: dao.find_by(query), number=number) / number
+        print(f'find_by {name} {new * 1000:.2f}ms, {old / new:.1f}x')
@@ -0,0 +1,32 @@
+#!/usr/bin/env python
+"""
+Compares the cached serializer with signature introspection on every to_dict call.
+"""
+import timeit
+import inspect
+import datetime
+
+from energyweb.eds.interfaces import EnergyData
+
+
+def introspected(obj):
+    result = {}
+    for parameter in inspect.signature(obj.__init__).parameters:
+        att = getattr(obj, parameter)
+        if isinstance(att, (datetime.datetime, datetime.date)):
+            att = att.isoformat()
+        to_dict = getattr(att, 'to_dict', None)
+        result[parameter] = introspected(att) if to_dict else att
+    return result
+
+
+if __name__ == '__main__':
+    number = 100000
+    reading = EnergyData(None, datetime.datetime.now(), '<raw/>', 1234567, datetime.datetime.now())
+    if introspected(reading) != reading.to_dict():
+        raise AssertionError('Serializers disagree')
+    old = timeit.timeit(lambda: introspected(reading), number=number)
+    new = timeit.timeit(reading.to_dict, number=number)
+    encoded = timeit.timeit(reading.to_bytes, number=number)
+    print(f'introspected {old / number * 10 ** 6:.1f}us, cached {new / number * 10 ** 6:.1f}us, {old / new:.2f}x, '
+          f'to_bytes {encoded / number * 10 ** 6:.1f}us')
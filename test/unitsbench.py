@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+"""
+Compares the precomputed factor conversions with the former per call dictionary of conversions.
+"""
+import random
+import timeit
+
+from energyweb.eds.units import EnergyUnit, to_wh, to_wh_series, sum_wh
+
+
+def dict_to_wh(energy, unit):
+    convert = lambda x: int(float(energy * x))
+    return {
+        EnergyUnit.WATT_HOUR: convert(1),
+        EnergyUnit.KILOWATT_HOUR: convert(10 ** 3),
+        EnergyUnit.MEGAWATT_HOUR: convert(10 ** 6),
+        EnergyUnit.GIGAWATT_HOUR: convert(10 ** 9),
+        EnergyUnit.JOULES: convert(1 * 2.77778 * 10 ** -1),
+    }.get(unit)
+
+
+if __name__ == '__main__':
+    number = 10
+    unit = EnergyUnit.KILOWATT_HOUR
+    integers = [random.randint(0, 10 ** 6) for _ in range(86400)]
+    decimals = [round(random.uniform(0, 100), 2) for _ in range(86400)]
+    inexact = sum(dict_to_wh(v, unit) != to_wh(v, unit) for v in decimals)
+    print(f'{inexact} of {len(decimals)} decimal kWh values truncated below their exact Wh by the former conversion')
+    for name, values in (('integer', integers), ('decimal', decimals)):
+        old = timeit.timeit(lambda: [dict_to_wh(v, unit) for v in values], number=number) / number
+        single = timeit.timeit(lambda: [to_wh(v, unit) for v in values], number=number) / number
+        series = timeit.timeit(lambda: to_wh_series(values, unit), number=number) / number
+        total = timeit.timeit(lambda: sum_wh(values, unit), number=number) / number
+        print(f'{len(values)} {name} values: per call dict {old * 1000:.1f}ms, to_wh {single * 1000:.1f}ms, '
+              f'to_wh_series {series * 1000:.1f}ms, sum_wh {total * 1000:.1f}ms')